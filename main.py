@@ -55,6 +55,10 @@ async def lifespan(app: FastAPI):
         openai_service = get_openai_service()
         print("✅ OpenAI service initialized")
         
+        # Surface the loop implementation so a silent fallback from uvloop shows up
+        loop_module = type(asyncio.get_running_loop()).__module__.split('.')[0]
+        print(f"✅ Event loop: {loop_module}")
+        
         websocket_manager = get_websocket_manager()
         print("✅ WebSocket manager initialized")
         
@@ -406,10 +410,19 @@ if __name__ == "__main__":
 ╚══════════════════════════════════════════════════════════════╝
     """)
     
+    # uvloop's libuv transports roughly double websocket throughput
+    try:
+        import uvloop  # noqa: F401
+        event_loop = "uvloop"
+    except ImportError:
+        event_loop = "asyncio"
+    
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
+        loop=event_loop,
+        ws_per_message_deflate=False,  # PCM16 audio doesn't compress
         reload=settings.debug,
         log_level=settings.log_level.lower(),
         access_log=True,
@@ -66,10 +66,11 @@ class SystemPromptResponse(BaseModel):
     @classmethod
     def from_system_prompt(cls, prompt: SystemPrompt) -> "SystemPromptResponse":
         """Create response from SystemPrompt model"""
-        return cls(
+        # The source model is already validated; skip re-validating each field
+        return cls.model_construct(
             season=prompt.season,
             episode=prompt.episode,
-            prompt_type=prompt.prompt_type.value,
+            prompt_type=prompt.prompt_type,
             prompt_length=len(prompt.prompt),
             version=prompt.version,
             is_active=prompt.is_active,
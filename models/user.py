@@ -37,6 +37,13 @@ class UserProgress(BaseModel):
     total_time: float = Field(default=0.0, ge=0, description="Total time spent in seconds")
     episodes_completed: int = Field(default=0, ge=0, description="Total episodes completed")
     
+    @property
+    def average_session_time(self) -> float:
+        """Average time spent per completed episode, in seconds"""
+        if self.episodes_completed == 0:
+            return 0.0
+        return self.total_time / self.episodes_completed
+    
     def advance_episode(self, episodes_per_season: int = 7) -> bool:
         """Advance to next episode/season. Returns True if advanced to new season"""
         self.episodes_completed += 1
@@ -82,11 +89,12 @@ class UserResponse(BaseModel):
     @classmethod
     def from_user(cls, user: User) -> "UserResponse":
         """Create response from User model"""
-        return cls(
+        # The source model is already validated; skip re-validating each field
+        return cls.model_construct(
             device_id=user.device_id,
             name=user.name,
             age=user.age,
-            status=user.status.value,
+            status=user.status,
             season=user.progress.season,
             episode=user.progress.episode,
             words_learnt_count=len(user.progress.words_learnt),
@@ -2,6 +2,7 @@
 User management routes (Fixed)
 """
 from fastapi import APIRouter, HTTPException, status, Query, Depends
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
 
 from models.user import UserResponse, SessionInfo
@@ -93,6 +94,7 @@ async def get_user(device_id: str, user_service: UserService = Depends(get_user_
 
 
 @router.get("/{device_id}/statistics",
+            response_class=ORJSONResponse,
             summary="Get user statistics",
             description="Get comprehensive statistics for a user")
 async def get_user_statistics(device_id: str, user_service: UserService = Depends(get_user_service_dependency)):
@@ -105,7 +107,9 @@ async def get_user_statistics(device_id: str, user_service: UserService = Depend
         statistics = await user_service.get_user_statistics(device_id)
         
         user_routes.log_info(f"User statistics retrieved: {device_id}")
-        return statistics
+        # Returned as a response so FastAPI skips jsonable_encoder; the
+        # payload is already JSON-ready and orjson encodes it in C
+        return ORJSONResponse(statistics)
         
     except ValidationException as e:
         raise HTTPException(
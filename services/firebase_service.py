@@ -2,10 +2,12 @@
 Firebase service for handling database operations
 """
 import asyncio
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import NotFound
 from google.cloud.firestore import Client, DocumentSnapshot, CollectionReference
 
 from config.settings import get_settings
@@ -25,6 +27,16 @@ class FirebaseService(LoggerMixin):
         super().__init__()
         self.settings = get_settings()
         self.db: Optional[Client] = None
+        
+        # Several endpoints read the same user back to back (e.g. a
+        # dashboard loading stats and session info), so user reads are
+        # served from memory for user_cache_ttl seconds. Every user write
+        # here drops the entry; a read overlapping a write, or a write made
+        # elsewhere, can leave a copy at most user_cache_ttl seconds old.
+        self.user_cache_ttl = 2
+        self.user_cache_size = 10000
+        self._user_cache: Dict[str, Tuple[float, User]] = {}
+        
         self._initialize_firebase()
     
     def _initialize_firebase(self):
@@ -46,6 +58,24 @@ class FirebaseService(LoggerMixin):
             self.log_error(f"Failed to initialize Firebase: {e}", exc_info=True)
             raise FirebaseException("initialize", str(e))
     
+    def _cache_user(self, user: User):
+        """Remember a user read for user_cache_ttl seconds"""
+        cache = self._user_cache
+        cache.pop(user.device_id, None)
+        if len(cache) >= self.user_cache_size:
+            # Oldest insertion first
+            del cache[next(iter(cache))]
+        cache[user.device_id] = (time.monotonic() + self.user_cache_ttl, user)
+    
+    def _invalidate_user(self, device_id: str):
+        """Drop a cached user before it is written"""
+        self._user_cache.pop(device_id, None)
+    
+    async def _run_in_executor(self, func):
+        """Run a blocking Firestore call in the default executor"""
+        # get_running_loop() is a direct C lookup, unlike get_event_loop()
+        return await asyncio.get_running_loop().run_in_executor(None, func)
+    
     # User operations
     async def create_user(self, device_id: str, name: str, age: int) -> User:
         """
@@ -82,8 +112,8 @@ class FirebaseService(LoggerMixin):
             
             # Save to Firebase
             user_data = self._user_to_dict(user)
-            await asyncio.get_event_loop().run_in_executor(
-                None, 
+            self._invalidate_user(device_id)
+            await self._run_in_executor(
                 lambda: self.db.collection('users').document(device_id).set(user_data)
             )
             
@@ -96,13 +126,15 @@ class FirebaseService(LoggerMixin):
             self.log_error(f"Failed to create user {device_id}: {e}", exc_info=True)
             raise FirebaseException("create_user", str(e), "users", device_id)
     
-    async def get_user(self, device_id: str, raise_if_not_found: bool = True) -> Optional[User]:
+    async def get_user(self, device_id: str, raise_if_not_found: bool = True,
+                       use_cache: bool = True) -> Optional[User]:
         """
         Retrieve user from Firebase
         
         Args:
             device_id: Unique device identifier
             raise_if_not_found: Whether to raise exception if user not found
+            use_cache: Whether a recently read copy may be returned
             
         Returns:
             Optional[User]: User object if found, None otherwise
@@ -111,9 +143,13 @@ class FirebaseService(LoggerMixin):
             UserNotFoundException: If user not found and raise_if_not_found is True
             FirebaseException: If database operation fails
         """
+        if use_cache:
+            cached = self._user_cache.get(device_id)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        
         try:
-            doc_snapshot = await asyncio.get_event_loop().run_in_executor(
-                None,
+            doc_snapshot = await self._run_in_executor(
                 lambda: self.db.collection('users').document(device_id).get()
             )
             
@@ -122,8 +158,9 @@ class FirebaseService(LoggerMixin):
                     raise UserNotFoundException(device_id)
                 return None
             
-            user_data = doc_snapshot.to_dict()
-            return self._dict_to_user(user_data)
+            user = self._dict_to_user(doc_snapshot.to_dict())
+            self._cache_user(user)
+            return user
             
         except UserNotFoundException:
             raise
@@ -147,50 +184,133 @@ class FirebaseService(LoggerMixin):
             FirebaseException: If database operation fails
         """
         try:
-            # Verify user exists
-            await self.get_user(device_id)
-            
             # Add timestamp to updates
             updates['last_active'] = datetime.now()
             
-            # Update in Firebase
-            await asyncio.get_event_loop().run_in_executor(
-                None,
+            # Update in Firebase; update() fails on a missing document, so
+            # no separate existence read is needed first
+            self._invalidate_user(device_id)
+            await self._run_in_executor(
                 lambda: self.db.collection('users').document(device_id).update(updates)
             )
             
-            # Return updated user
-            return await self.get_user(device_id)
+            # Return updated user, read fresh after the write
+            return await self.get_user(device_id, use_cache=False)
             
+        except NotFound:
+            raise UserNotFoundException(device_id)
         except UserNotFoundException:
             raise
         except Exception as e:
             self.log_error(f"Failed to update user {device_id}: {e}", exc_info=True)
             raise FirebaseException("update_user", str(e), "users", device_id)
     
-    async def update_user_progress(self, device_id: str, progress: UserProgress) -> User:
+    async def deactivate_user(self, device_id: str):
         """
-        Update user progress in Firebase
+        Soft delete a user by marking it inactive
+        
+        A single write: the deletion time is set by Firestore, and the user
+        is not read back.
         
         Args:
             device_id: Unique device identifier
-            progress: Updated progress object
+            
+        Raises:
+            UserNotFoundException: If user not found
+            FirebaseException: If database operation fails
+        """
+        try:
+            self._invalidate_user(device_id)
+            await self._run_in_executor(
+                lambda: self.db.collection('users').document(device_id).update({
+                    'status': UserStatus.INACTIVE.value,
+                    'deleted_at': firestore.SERVER_TIMESTAMP
+                })
+            )
+            
+        except NotFound:
+            raise UserNotFoundException(device_id)
+        except Exception as e:
+            self.log_error(f"Failed to deactivate user {device_id}: {e}", exc_info=True)
+            raise FirebaseException("deactivate_user", str(e), "users", device_id)
+    
+    async def append_user_progress(self, device_id: str, words_learnt: List[str] = None,
+                                   topics_learnt: List[str] = None) -> User:
+        """
+        Add learned words and topics to a user's progress
+        
+        Firestore merges them into the stored lists server-side, skipping
+        any already present, so only the new entries are sent.
+        
+        Args:
+            device_id: Unique device identifier
+            words_learnt: Words to add
+            topics_learnt: Topics to add
             
         Returns:
             User: Updated user object
         """
-        updates = {
-            'progress.season': progress.season,
-            'progress.episode': progress.episode,
-            'progress.words_learnt': progress.words_learnt,
-            'progress.topics_learnt': progress.topics_learnt,
-            'progress.total_time': progress.total_time,
-            'progress.episodes_completed': progress.episodes_completed,
-            'last_completed_episode': datetime.now()
-        }
+        updates = {}
+        if words_learnt:
+            updates['progress.words_learnt'] = firestore.ArrayUnion(words_learnt)
+        if topics_learnt:
+            updates['progress.topics_learnt'] = firestore.ArrayUnion(topics_learnt)
         
         return await self.update_user(device_id, updates)
     
+    async def advance_user_episode(self, device_id: str,
+                                   episodes_per_season: int) -> Tuple[Dict[str, Any], User]:
+        """
+        Advance a user to the next episode in a single transaction
+        
+        The read and the write are atomic, so concurrent advances for the
+        same device can't overwrite each other.
+        
+        Args:
+            device_id: Unique device identifier
+            episodes_per_season: Episodes in each season
+            
+        Returns:
+            Tuple[Dict[str, Any], User]: (progress before advancing, updated user)
+            
+        Raises:
+            UserNotFoundException: If user not found
+            FirebaseException: If database operation fails
+        """
+        user_ref = self.db.collection('users').document(device_id)
+        
+        @firestore.transactional
+        def advance(transaction) -> Tuple[Dict[str, Any], User]:
+            snapshot = user_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise UserNotFoundException(device_id)
+            
+            user = self._dict_to_user(snapshot.to_dict())
+            old_progress = user.progress.dict()
+            user.progress.advance_episode(episodes_per_season)
+            user.last_completed_episode = user.last_active = datetime.now()
+            
+            # Only the fields an advance changes; the learned word and topic
+            # lists can be long and are left as they are
+            transaction.update(user_ref, {
+                'progress.season': user.progress.season,
+                'progress.episode': user.progress.episode,
+                'progress.episodes_completed': user.progress.episodes_completed,
+                'last_completed_episode': user.last_completed_episode,
+                'last_active': user.last_active
+            })
+            return old_progress, user
+        
+        try:
+            self._invalidate_user(device_id)
+            return await self._run_in_executor(lambda: advance(self.db.transaction()))
+            
+        except UserNotFoundException:
+            raise
+        except Exception as e:
+            self.log_error(f"Failed to advance episode for {device_id}: {e}", exc_info=True)
+            raise FirebaseException("advance_episode", str(e), "users", device_id)
+    
     async def increment_user_time(self, device_id: str, time_seconds: float):
         """
         Increment user's total time spent
@@ -200,8 +320,8 @@ class FirebaseService(LoggerMixin):
             time_seconds: Time to add in seconds
         """
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None,
+            self._invalidate_user(device_id)
+            await self._run_in_executor(
                 lambda: self.db.collection('users').document(device_id).update({
                     'progress.total_time': firestore.Increment(time_seconds),
                     'last_active': datetime.now()
@@ -215,7 +335,7 @@ class FirebaseService(LoggerMixin):
     # System prompt operations
     async def create_system_prompt(self, season: int, episode: int, prompt: str, 
                                  prompt_type: PromptType = PromptType.LEARNING,
-                                 metadata: Dict[str, Any] = None) -> SystemPrompt:
+                                 metadata: Dict[str, Any] = None) -> Tuple[SystemPrompt, bool]:
         """
         Create or update system prompt in Firebase
         
@@ -227,7 +347,7 @@ class FirebaseService(LoggerMixin):
             metadata: Additional metadata
             
         Returns:
-            SystemPrompt: Created prompt object
+            Tuple[SystemPrompt, bool]: (stored prompt, whether it was written)
         """
         try:
             prompt_obj = SystemPrompt(
@@ -245,23 +365,66 @@ class FirebaseService(LoggerMixin):
             # Check if prompt already exists to increment version
             existing_prompt = await self.get_system_prompt(season, episode, raise_if_not_found=False)
             if existing_prompt:
+                # Re-uploading an identical active prompt is a no-op; skip
+                # the write and keep its version
+                if (existing_prompt.is_active
+                        and existing_prompt.prompt == prompt_obj.prompt
+                        and existing_prompt.prompt_type == prompt_obj.prompt_type
+                        and existing_prompt.metadata == prompt_obj.metadata):
+                    return existing_prompt, False
                 prompt_obj.version = existing_prompt.version + 1
             
             prompt_data = self._system_prompt_to_dict(prompt_obj)
             doc_id = f"season_{season}_episode_{episode}"
             
-            await asyncio.get_event_loop().run_in_executor(
-                None,
+            await self._run_in_executor(
                 lambda: self.db.collection('system_prompts').document(doc_id).set(prompt_data)
             )
             
             self.log_info(f"System prompt created: Season {season}, Episode {episode}")
-            return prompt_obj
+            return prompt_obj, True
             
         except Exception as e:
             self.log_error(f"Failed to create system prompt S{season}E{episode}: {e}", exc_info=True)
             raise FirebaseException("create_system_prompt", str(e), "system_prompts")
     
+    async def update_system_prompt(self, season: int, episode: int, updates: Dict[str, Any]):
+        """
+        Update fields of an existing system prompt in place
+        
+        Only the given fields are written; nested keys can be addressed with
+        dotted paths (e.g. 'metadata.is_active'). The version is bumped as a
+        full rewrite would.
+        
+        Args:
+            season: Season number
+            episode: Episode number
+            updates: Dictionary of fields to update
+            
+        Raises:
+            SystemPromptNotFoundException: If prompt not found
+            FirebaseException: If database operation fails
+        """
+        try:
+            doc_id = f"season_{season}_episode_{episode}"
+            updates = {
+                **updates,
+                'updated_at': datetime.now(),
+                'version': firestore.Increment(1)
+            }
+            
+            await self._run_in_executor(
+                lambda: self.db.collection('system_prompts').document(doc_id).update(updates)
+            )
+            
+            self.log_info(f"System prompt updated: Season {season}, Episode {episode}")
+            
+        except NotFound:
+            raise SystemPromptNotFoundException(season, episode)
+        except Exception as e:
+            self.log_error(f"Failed to update system prompt S{season}E{episode}: {e}", exc_info=True)
+            raise FirebaseException("update_system_prompt", str(e), "system_prompts")
+    
     async def get_system_prompt(self, season: int, episode: int, 
                               raise_if_not_found: bool = True) -> Optional[SystemPrompt]:
         """
@@ -277,8 +440,7 @@ class FirebaseService(LoggerMixin):
         """
         try:
             doc_id = f"season_{season}_episode_{episode}"
-            doc_snapshot = await asyncio.get_event_loop().run_in_executor(
-                None,
+            doc_snapshot = await self._run_in_executor(
                 lambda: self.db.collection('system_prompts').document(doc_id).get()
             )
             
@@ -296,12 +458,14 @@ class FirebaseService(LoggerMixin):
             self.log_error(f"Failed to get system prompt S{season}E{episode}: {e}", exc_info=True)
             raise FirebaseException("get_system_prompt", str(e), "system_prompts")
     
-    async def get_all_prompts_for_season(self, season: int) -> List[SystemPrompt]:
+    async def get_all_prompts_for_season(self, season: int,
+                                         prompt_type: Optional[PromptType] = None) -> List[SystemPrompt]:
         """
         Get all prompts for a specific season
         
         Args:
             season: Season number
+            prompt_type: Only return prompts of this type
             
         Returns:
             List[SystemPrompt]: List of prompts for the season
@@ -309,10 +473,10 @@ class FirebaseService(LoggerMixin):
         try:
             prompts = []
             query = self.db.collection('system_prompts').where('season', '==', season)
+            if prompt_type:
+                query = query.where('prompt_type', '==', PromptType(prompt_type).value)
             
-            docs = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: query.get()
-            )
+            docs = await self._run_in_executor(query.get)
             
             for doc in docs:
                 prompt_data = doc.to_dict()
@@ -324,6 +488,29 @@ class FirebaseService(LoggerMixin):
             self.log_error(f"Failed to get prompts for season {season}: {e}", exc_info=True)
             raise FirebaseException("get_season_prompts", str(e), "system_prompts")
     
+    async def get_all_prompts_grouped_by_season(self) -> Dict[int, List[SystemPrompt]]:
+        """
+        Get every prompt in one query, grouped by season
+        
+        Returns:
+            Dict[int, List[SystemPrompt]]: Prompts per season, sorted by episode
+        """
+        try:
+            docs = await self._run_in_executor(self.db.collection('system_prompts').get)
+            
+            grouped: Dict[int, List[SystemPrompt]] = {}
+            for doc in docs:
+                prompt = self._dict_to_system_prompt(doc.to_dict())
+                grouped.setdefault(prompt.season, []).append(prompt)
+            
+            for prompts in grouped.values():
+                prompts.sort(key=lambda p: p.episode)
+            return grouped
+            
+        except Exception as e:
+            self.log_error(f"Failed to get all prompts: {e}", exc_info=True)
+            raise FirebaseException("get_all_prompts", str(e), "system_prompts")
+    
     # Utility methods
     def _user_to_dict(self, user: User) -> Dict[str, Any]:
         """Convert User object to dictionary for Firebase"""
@@ -400,8 +587,7 @@ class FirebaseService(LoggerMixin):
         """Check Firebase connection health"""
         try:
             # Try a simple read operation
-            await asyncio.get_event_loop().run_in_executor(
-                None,
+            await self._run_in_executor(
                 lambda: self.db.collection('_health_check').limit(1).get()
             )
             return True
@@ -3,27 +3,255 @@ Fixed OpenAI Realtime API service - RACE CONDITION SAFE
 """
 import asyncio
 import json
-import base64
+import binascii
+import functools
+import inspect
+import logging
+import socket
+import ssl
+import time
 import websockets
-from typing import Optional, Callable
+from collections import deque
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Optional, Callable, Awaitable, Union, Dict, List, Tuple
+
+from config.settings import get_settings
 from utils.logger import LoggerMixin
 
 
+# Hot-path codec functions bound once at import. pybase64 (SIMD) is
+# preferred; where it isn't installed binascii is called directly, skipping
+# the argument normalisation the base64 module wraps around it.
+try:
+    import pybase64
+    _b64decode = pybase64.b64decode
+    _b64encode = pybase64.b64encode
+    _B64_CODEC = f"pybase64 {pybase64.get_version()}"
+except ImportError:
+    _b64decode = binascii.a2b_base64
+    _b64encode = functools.partial(binascii.b2a_base64, newline=False)
+    _B64_CODEC = "binascii"
+
+# Every incoming event is parsed, so orjson is used when available.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+
+# Per-frame log formats: ASCII only, formatted lazily at DEBUG level.
+# Emoji are kept for once-per-conversation lifecycle events.
+_LOG_MESSAGE = "OpenAI message for %s: %s"
+_LOG_AUDIO_STATS = "Audio for %s: %d deltas, %d bytes in, %d bytes out"
+_LOG_AUDIO_DROPS = "Dropped %d audio chunks for %s: OpenAI send is backed up"
+_LOG_FULL_MESSAGE = "Full message for %s: %r"
+_DEBUG = logging.DEBUG
+
+# Shared read-only default for missing nested event objects
+_EMPTY = MappingProxyType({})
+
+# Receives (device_id, audio) where audio is PCM16 bytes, or the undecoded
+# base64 str for raw_audio=False connections. Coroutine functions are awaited
+# on the loop; plain functions are run in the default executor.
+AudioCallback = Callable[[str, Union[bytes, str]], Union[None, Awaitable[None]]]
+
+# One TLS context for every device - avoids reloading the CA store per connect
+_SSL_CONTEXT = ssl.create_default_context()
+
+_REALTIME_HOST = "api.openai.com"
+
+# Resolved Realtime API addresses, reused across connects:
+# host -> (ips in resolver order, expiry)
+_DNS_TTL = 60
+_dns_cache: Dict[str, Tuple[Tuple[str, ...], float]] = {}
+
+
+async def _resolve(host: str) -> Tuple[str, ...]:
+    """Resolve host to its IP addresses, cached for _DNS_TTL seconds"""
+    now = time.monotonic()
+    cached = _dns_cache.get(host)
+    if cached and cached[1] > now:
+        return cached[0]
+    
+    infos = await asyncio.get_running_loop().getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+    addresses = tuple(dict.fromkeys(info[4][0] for info in infos))
+    _dns_cache[host] = (addresses, now + _DNS_TTL)
+    return addresses
+
+
+def _prefer_address(host: str, address: str):
+    """Move an address that just connected to the front of the cached list"""
+    cached = _dns_cache.get(host)
+    if cached and cached[0][0] != address and address in cached[0]:
+        addresses = (address,) + tuple(a for a in cached[0] if a != address)
+        _dns_cache[host] = (addresses, cached[1])
+
+
+def _set_nodelay(transport: asyncio.BaseTransport):
+    """Disable Nagle on a connection's socket, where one is exposed"""
+    sock = transport.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+# Static session.update payload - only "instructions" varies per device
+_SESSION_TEMPLATE = {
+    "type": "session.update",
+    "session": {
+        # FIXED: Specify both text and audio modalities for speech-to-speech
+        "modalities": ["text", "audio"],
+        "voice": "ballad",
+        "input_audio_format": "pcm16",
+        "output_audio_format": "pcm16",
+        # FIXED: Enable input audio transcription to help with debugging
+        "input_audio_transcription": {
+            "model": "whisper-1"
+        },
+        "turn_detection": {
+            "type": "server_vad",
+            "threshold": 0.5,
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 800  # Wait 800ms before responding
+        }
+    }
+}
+
+
+# input_audio_buffer.append framing around the base64 payload. Base64 needs
+# no JSON escaping, so frames are concatenated without json.dumps. They go
+# out as str, since the API only accepts text frames.
+_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+_APPEND_SUFFIX = '"}'
+
+# Compact serialization OpenAI uses for audio deltas, matched textually by
+# the listen loop's fast path
+_DELTA_EVENT_PREFIX = '{"type":"response.audio.delta"'
+_DELTA_EVENT_PREFIX_LEN = len(_DELTA_EVENT_PREFIX)
+_DELTA_KEY = '"delta":"'
+_DELTA_KEY_LEN = len(_DELTA_KEY)
+
+# Control messages are serialized once at import
+_COMMIT_MESSAGE = _json_dumps({"type": "input_audio_buffer.commit"}).decode()
+
+_RESPONSE_CREATE_MESSAGE = _json_dumps({
+    "type": "response.create",
+    "response": {
+        "modalities": ["text", "audio"],
+        "instructions": "Please respond with both text and audio. Provide a helpful and engaging response.",
+    }
+}).decode()
+
+# Connection state bits; sending needs both, so READY is a single compare
+_CONNECTED = 1
+_CONFIGURED = 2
+_READY = _CONNECTED | _CONFIGURED
+
+
+@functools.lru_cache(maxsize=64)
+def _session_update_message(system_prompt: str, output_audio_format: str) -> str:
+    """Serialized session.update message, cached per system prompt and output format"""
+    return _json_dumps({
+        **_SESSION_TEMPLATE,
+        "session": {
+            **_SESSION_TEMPLATE["session"],
+            "instructions": system_prompt,
+            "output_audio_format": output_audio_format
+        }
+    }).decode()
+
+
 class OpenAIConnection(LoggerMixin):
     """Fixed OpenAI Realtime API connection"""
     
+    # One instance per connected device, touched on every audio frame
+    __slots__ = (
+        'device_id', 'system_prompt', 'api_key', 'audio_callback', 'raw_audio',
+        'output_audio_format',
+        'websocket', '_state', 'last_activity',
+        'pending_audio_queue', 'min_audio_duration_ms', '_min_bytes',
+        'max_audio_delay_ms', '_flush_timer',
+        'audio_buffer', '_write_pos',
+        '_send_queue', '_queued_audio', 'max_queued_audio', 'drops', '_sender_task', '_listen_task',
+        'stats_interval', '_stats_task', '_delta_count', '_bytes_in', '_bytes_out',
+        '_playback_queue', '_playback_task',
+    )
+    
     def __init__(self, device_id: str, system_prompt: str, api_key: str,
-                 audio_callback: Callable[[str, bytes], None]):
+                 audio_callback: AudioCallback, raw_audio: bool = True,
+                 output_audio_format: str = "pcm16"):
         super().__init__()
         self.device_id = device_id
         self.system_prompt = system_prompt
         self.api_key = api_key
         self.audio_callback = audio_callback
+        # False hands deltas to the callback still base64-encoded, for
+        # consumers that forward them over a text channel anyway
+        self.raw_audio = raw_audio
+        # "g711_ulaw"/"g711_alaw" cut response audio to 8 kHz 8-bit, for
+        # devices that can decode it; input stays pcm16 either way
+        self.output_audio_format = output_audio_format
         
         self.websocket: Optional[websockets.WebSocketClientProtocol] = None
-        self.is_connected = False
-        self.session_configured = False
+        self._state = 0
+        self.last_activity = time.monotonic()
+        
+        # Audio received before session.updated, flushed once configured.
+        # Bounded so a session that never configures can't grow it forever;
+        # the oldest chunks are dropped first.
+        self.pending_audio_queue = deque(maxlen=256)
+        
+        # Outgoing PCM16 is coalesced into appends of at least
+        # min_audio_duration_ms; the buffer is allocated once per connection
+        self.min_audio_duration_ms = 200
+        self._min_bytes = (self.min_audio_duration_ms * 16000 * 2) // 1000
+        self.audio_buffer = bytearray(self._min_bytes * 2)
+        self._write_pos = 0
+        # A partial batch is sent anyway once it has waited this long, so
+        # the tail of an utterance reaches server VAD without a commit
+        self.max_audio_delay_ms = 250
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        
+        # Configured audio is handed to a per-connection sender task, which
+        # drains everything queued since its last send into one append
+        self._send_queue: Optional[asyncio.Queue] = None
+        # Only grows while a write to OpenAI is stalled; past this many
+        # queued chunks new audio is dropped (and counted) rather than held.
+        # Audio is counted on its own, so queued control messages and
+        # flush wake-ups never push it over the cap.
+        self._queued_audio = 0
+        self.max_queued_audio = 32
+        self.drops = 0
+        self._sender_task: Optional[asyncio.Task] = None
+        self._listen_task: Optional[asyncio.Task] = None
         
+        # Decoded audio is handed to the callback by its own task, so a slow
+        # downstream device never holds up reading from OpenAI
+        self._playback_queue: Optional[asyncio.Queue] = None
+        self._playback_task: Optional[asyncio.Task] = None
+        
+        # Per-frame audio is counted rather than logged; the totals are
+        # reported and reset every stats_interval seconds while active
+        self.stats_interval = 1.0
+        self._stats_task: Optional[asyncio.Task] = None
+        self._delta_count = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        
+    @property
+    def is_connected(self) -> bool:
+        """Whether the OpenAI websocket is open"""
+        return bool(self._state & _CONNECTED)
+    
+    @property
+    def session_configured(self) -> bool:
+        """Whether session.updated has been received"""
+        return bool(self._state & _CONFIGURED)
+    
     async def connect(self):
         """Connect to OpenAI Realtime API"""
         try:
@@ -32,198 +260,474 @@ class OpenAIConnection(LoggerMixin):
                 "OpenAI-Beta": "realtime=v1"
             }
             
-            # Connect to OpenAI - FIXED: Use the correct URL with model parameter
-            self.websocket = await websockets.connect(
-                "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-12-17",
-                extra_headers=headers,
-                ping_interval=30
-            )
+            # Dial the cached addresses in turn, so one unreachable record
+            # doesn't fail every connect until the cache expires
+            addresses = await _resolve(_REALTIME_HOST)
+            for index, address in enumerate(addresses):
+                try:
+                    self.websocket = await self._open_websocket(address, headers)
+                    break
+                except (OSError, asyncio.TimeoutError) as e:
+                    if index == len(addresses) - 1:
+                        raise
+                    self.log_warning(f"⚠️ OpenAI address {address} failed for {self.device_id}: {e}")
+            _prefer_address(_REALTIME_HOST, address)
+            # Appends and control messages are small and latency-bound; with
+            # Nagle on they can wait up to an RTT for the previous ACK. Audio
+            # is already coalesced per append, so the extra packets are few.
+            # asyncio and uvloop normally set this already - made explicit
+            # so it doesn't depend on the event loop. Buffer sizes are left
+            # alone: setting SO_SNDBUF/SO_RCVBUF turns off Linux autotuning.
+            _set_nodelay(self.websocket.transport)
             
-            self.is_connected = True
+            self._state |= _CONNECTED
             self.log_info(f"Connected to OpenAI for {self.device_id}")
             
+            self._send_queue = asyncio.Queue()
+            self._sender_task = asyncio.create_task(
+                self._sender_loop(), name=f"openai-send-{self.device_id}"
+            )
+            
+            self._playback_queue = asyncio.Queue()
+            self._playback_task = asyncio.create_task(
+                self._playback_loop(), name=f"openai-playback-{self.device_id}"
+            )
+            
             # Start listening for messages
-            asyncio.create_task(self._listen_loop())
+            self._listen_task = asyncio.create_task(
+                self._listen_loop(), name=f"openai-listen-{self.device_id}"
+            )
+            self._stats_task = asyncio.create_task(
+                self._stats_loop(), name=f"openai-stats-{self.device_id}"
+            )
             
         except Exception as e:
+            # The cached addresses may have gone stale; resolve again next time
+            _dns_cache.pop(_REALTIME_HOST, None)
             self.log_error(f"Failed to connect to OpenAI for {self.device_id}: {e}")
             raise
     
+    async def _open_websocket(self, address: str, headers: Dict[str, str]):
+        """Open the Realtime API websocket through one resolved address"""
+        # Connect to OpenAI - FIXED: Use the correct URL with model parameter
+        return await websockets.connect(
+            f"wss://{_REALTIME_HOST}/v1/realtime?model=gpt-4o-realtime-preview-2024-12-17",
+            extra_headers=headers,
+            ssl=_SSL_CONTEXT,
+            # SNI and certificate checks still use the real hostname
+            host=address,
+            port=443,
+            server_hostname=_REALTIME_HOST,
+            ping_interval=30,
+            # Base64 audio doesn't deflate; skip permessage-deflate CPU
+            compression=None,
+            # Trusted peer, large audio deltas
+            max_size=None,
+            read_limit=2 ** 20,
+            write_limit=2 ** 20
+        )
+    
     async def _listen_loop(self):
         """Listen for messages from OpenAI"""
+        # Bind hot lookups once for the lifetime of the loop
+        recv = self.websocket.recv
+        loads = _json_loads
+        handle = self._handle_message
+        forward_audio = self._forward_audio
+        monotonic = time.monotonic
+        # At DEBUG every fast-path slice is checked against a full parse
+        verify = self.logger.isEnabledFor(_DEBUG)
+        
         try:
-            async for message in self.websocket:
-                await self._handle_message(json.loads(message))
+            # recv() returns without suspending while frames are already
+            # queued, so bursts of deltas drain in one scheduling slice.
+            # The protocol's message deque is deliberately not popped
+            # directly: recv() is what resumes reading once the queue drops
+            # below max_queue, so bypassing it would stall flow control.
+            while self._state & _CONNECTED:
+                # Text frames arrive as str (the legacy protocol always
+                # UTF-8 decodes them) and both parsers take str or bytes as
+                # is, so never re-encode here - that would add a full copy
+                message = await recv()
+                self.last_activity = monotonic()
+                
+                # Audio deltas are nearly all traffic: slice the payload out
+                # without building the event dict. Anything unexpected (other
+                # key order, escapes) falls through to the full parse.
+                if type(message) is str and message.startswith(_DELTA_EVENT_PREFIX):
+                    start = message.find(_DELTA_KEY, _DELTA_EVENT_PREFIX_LEN)
+                    if start != -1:
+                        start += _DELTA_KEY_LEN
+                        end = message.find('"', start)
+                        if end != -1 and message.find('\\', start, end) == -1:
+                            if verify:
+                                self._verify_fast_delta(message, start, end)
+                            forward_audio(message[start:end])
+                            continue
+                
+                await handle(loads(message))
+        except websockets.ConnectionClosed:
+            self.log_info(f"🔌 OpenAI websocket closed for {self.device_id}")
         except Exception as e:
             self.log_error(f"Listen loop error for {self.device_id}: {e}")
+        finally:
+            # Nothing reads from OpenAI any more: stop accepting audio and
+            # wake the sender and playback tasks so they exit too
+            self._state = 0
+            self._send_queue.put_nowait(None)
+            self._playback_queue.put_nowait(None)
+    
+    def _verify_fast_delta(self, message: str, start: int, end: int):
+        """Compare a fast-path delta slice with the fully parsed event"""
+        data = _json_loads(message)
+        if data.get('type') != 'response.audio.delta' or data.get('delta') != message[start:end]:
+            self.log_error(f"❌ Fast-path delta mismatch for {self.device_id}: {message[:120]!r}")
+    
+    async def _stats_loop(self):
+        """Log audio throughput once per interval, only while audio is flowing"""
+        reported_drops = 0
+        try:
+            while self._state & _CONNECTED:
+                await asyncio.sleep(self.stats_interval)
+                if self._delta_count or self._bytes_out:
+                    self.logger.info(_LOG_AUDIO_STATS, self.device_id,
+                                     self._delta_count, self._bytes_in, self._bytes_out)
+                    self._delta_count = self._bytes_in = self._bytes_out = 0
+                if self.drops != reported_drops:
+                    self.logger.warning(_LOG_AUDIO_DROPS, self.drops - reported_drops,
+                                        self.device_id)
+                    reported_drops = self.drops
+        except asyncio.CancelledError:
+            pass
     
     async def _handle_message(self, data: dict):
         """Handle messages from OpenAI"""
         msg_type = data.get('type')
-        self.log_info(f"📨 OpenAI message for {self.device_id}: {msg_type}")
-        
-        if msg_type == 'session.created':
-            self.log_info(f"🎉 Session created for {self.device_id}")
-            await self._configure_session()
+        if self.logger.isEnabledFor(_DEBUG):
+            self.logger.debug(_LOG_MESSAGE, self.device_id, msg_type)
         
-        elif msg_type == 'session.updated':
-            self.session_configured = True
-            self.log_info(f"✅ Session configured for {self.device_id}")
-        
-        elif msg_type == 'input_audio_buffer.speech_started':
-            self.log_info(f"🎤 Speech started detected for {self.device_id}")
-        
-        elif msg_type == 'input_audio_buffer.speech_stopped':
-            self.log_info(f"🔇 Speech stopped detected for {self.device_id}")
+        await _HANDLERS.get(msg_type, OpenAIConnection._on_unhandled)(self, data)
+    
+    async def _on_audio_delta(self, data: dict):
+        self._forward_audio(data.get('delta'))
+    
+    def _forward_audio(self, audio_b64: Optional[str]):
+        """Queue an audio delta for the ESP32; never suspends"""
+        if not audio_b64:
+            self.log_warning(f"⚠️ Empty audio delta for {self.device_id}")
+            return
         
-        elif msg_type == 'response.created':
-            response_id = data.get('response', {}).get('id', 'unknown')
-            self.log_info(f"🤖 Response created for {self.device_id}: {response_id}")
+        # Decoding happens in the playback task, keeping the listen loop to
+        # slicing and queueing
+        self._delta_count += 1
+        self._playback_queue.put_nowait(audio_b64)
+    
+    async def _playback_loop(self):
+        """Decode and deliver audio to the callback in order, off the listen loop"""
+        get = self._playback_queue.get
+        callback = self.audio_callback
+        device_id = self.device_id
+        decode = _b64decode if self.raw_audio else None
         
-        elif msg_type == 'response.output_item.added':
-            item = data.get('item', {})
-            item_type = item.get('type', 'unknown')
-            self.log_info(f"📝 Output item added for {self.device_id}: {item_type}")
+        # Coroutine callbacks are awaited here; plain functions may block,
+        # so they run in the default executor instead of on the loop
+        if inspect.iscoroutinefunction(callback):
+            deliver = callback
+        else:
+            run_in_executor = asyncio.get_running_loop().run_in_executor
             
-            # Log if it's an audio item
-            if item_type == 'audio':
-                self.log_info(f"🎵 Audio output item created for {self.device_id}")
-        
-        elif msg_type == 'response.content_part.added':
-            part = data.get('part', {})
-            part_type = part.get('type', 'unknown')
-            self.log_info(f"📄 Content part added for {self.device_id}: {part_type}")
-        
-        elif msg_type == 'response.audio.delta':
-            # Forward audio to ESP32
-            audio_b64 = data.get('delta')
-            if audio_b64:
-                audio_data = base64.b64decode(audio_b64)
-                self.log_info(f"🔊 Received audio delta for {self.device_id}: {len(audio_data)} bytes")
-                self.audio_callback(self.device_id, audio_data)
-            else:
-                self.log_warning(f"⚠️ Empty audio delta for {self.device_id}")
-        
-        elif msg_type == 'response.audio.done':
-            self.log_info(f"🎵 Audio response completed for {self.device_id}")
-        
-        elif msg_type == 'response.done':
-            response_id = data.get('response', {}).get('id', 'unknown')
-            self.log_info(f"✅ Response completed for {self.device_id}: {response_id}")
-        
-        elif msg_type == 'error':
-            error = data.get('error', {})
-            error_message = error.get('message', 'Unknown error')
-            error_code = error.get('code', 'unknown')
-            self.log_error(f"❌ OpenAI error for {self.device_id}: {error_code} - {error_message}")
-        
-        # FIXED: Add handling for conversation item events
-        elif msg_type == 'conversation.item.created':
-            item = data.get('item', {})
-            self.log_info(f"💬 Conversation item created for {self.device_id}: {item.get('type', 'unknown')}")
-        
-        elif msg_type == 'conversation.item.input_audio_transcription.completed':
-            transcript = data.get('transcript', '')
-            self.log_info(f"📝 Transcription completed for {self.device_id}: {transcript[:50]}...")
+            def deliver(device_id, audio_data):
+                return run_in_executor(None, callback, device_id, audio_data)
         
-        else:
-            self.log_info(f"🤔 Unhandled message type for {self.device_id}: {msg_type}")
-            # Log the full message for debugging unknown types
-            self.log_info(f"📋 Full message: {data}")
+        while self._state & _CONNECTED:
+            audio_data = await get()
+            if audio_data is None:
+                # Woken by the listen loop ending
+                break
+            try:
+                # Each delta gets its own bytes object on purpose: it's owned
+                # by the callback afterwards, so a pooled buffer could be
+                # overwritten before the ESP32 send completes
+                if decode is not None:
+                    audio_data = decode(audio_data)
+                self._bytes_in += len(audio_data)
+                await deliver(device_id, audio_data)
+            except Exception as e:
+                self.log_error(f"❌ Audio callback failed for {device_id}: {e}")
+    
+    async def _on_transcript_delta(self, data: dict):
+        """Transcript text streams alongside audio; nothing to forward"""
+    
+    async def _on_session_created(self, data: dict):
+        self.log_info(f"🎉 Session created for {self.device_id}")
+        await self._configure_session()
+    
+    async def _on_session_updated(self, data: dict):
+        self._state |= _CONFIGURED
+        self.log_info(f"✅ Session configured for {self.device_id}")
+        await self._process_queued_audio()
+    
+    async def _on_speech_started(self, data: dict):
+        self.log_info(f"🎤 Speech started detected for {self.device_id}")
+    
+    async def _on_speech_stopped(self, data: dict):
+        self.log_info(f"🔇 Speech stopped detected for {self.device_id}")
+    
+    async def _on_response_created(self, data: dict):
+        response_id = (data.get('response') or _EMPTY).get('id', 'unknown')
+        self.log_info(f"🤖 Response created for {self.device_id}: {response_id}")
+    
+    async def _on_output_item_added(self, data: dict):
+        item = data.get('item') or _EMPTY
+        item_type = item.get('type', 'unknown')
+        self.log_info(f"📝 Output item added for {self.device_id}: {item_type}")
+        
+        # Log if it's an audio item
+        if item_type == 'audio':
+            self.log_info(f"🎵 Audio output item created for {self.device_id}")
+    
+    async def _on_content_part_added(self, data: dict):
+        part = data.get('part') or _EMPTY
+        part_type = part.get('type', 'unknown')
+        self.log_info(f"📄 Content part added for {self.device_id}: {part_type}")
+    
+    async def _on_audio_done(self, data: dict):
+        self.log_info(f"🎵 Audio response completed for {self.device_id}")
+    
+    async def _on_response_done(self, data: dict):
+        response_id = (data.get('response') or _EMPTY).get('id', 'unknown')
+        self.log_info(f"✅ Response completed for {self.device_id}: {response_id}")
+    
+    async def _on_error(self, data: dict):
+        error = data.get('error') or _EMPTY
+        error_message = error.get('message', 'Unknown error')
+        error_code = error.get('code', 'unknown')
+        self.log_error(f"❌ OpenAI error for {self.device_id}: {error_code} - {error_message}")
+    
+    # FIXED: Add handling for conversation item events
+    async def _on_conversation_item_created(self, data: dict):
+        item = data.get('item') or _EMPTY
+        self.log_info(f"💬 Conversation item created for {self.device_id}: {item.get('type', 'unknown')}")
+    
+    async def _on_transcription_completed(self, data: dict):
+        transcript = data.get('transcript', '')
+        self.log_info(f"📝 Transcription completed for {self.device_id}: {transcript[:50]}...")
+    
+    async def _on_unhandled(self, data: dict):
+        self.log_info(f"🤔 Unhandled message type for {self.device_id}: {data.get('type')}")
+        # Stringifying the whole event is only worth it when debugging
+        if self.logger.isEnabledFor(_DEBUG):
+            self.logger.debug(_LOG_FULL_MESSAGE, self.device_id, data)
     
     async def _configure_session(self):
         """Configure the OpenAI session - FIXED VERSION"""
-        config = {
-            "type": "session.update",
-            "session": {
-                # FIXED: Specify both text and audio modalities for speech-to-speech
-                "modalities": ["text", "audio"],
-                "instructions": self.system_prompt,
-                "voice": "ballad",
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                # FIXED: Enable input audio transcription to help with debugging
-                "input_audio_transcription": {
-                    "model": "whisper-1"
-                },
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.5,
-                    "prefix_padding_ms": 300,
-                    "silence_duration_ms": 800  # Wait 800ms before responding
-                }
-            }
-        }
-        
-        await self.websocket.send(json.dumps(config))
+        await self.websocket.send(
+            _session_update_message(self.system_prompt, self.output_audio_format)
+        )
+        session = _SESSION_TEMPLATE["session"]
         self.log_info(f"✅ Session config sent for {self.device_id}")
-        self.log_info(f"📋 Config details: modalities={config['session']['modalities']}, voice={config['session']['voice']}")
+        self.log_info(f"📋 Config details: modalities={session['modalities']}, voice={session['voice']}, "
+                      f"output={self.output_audio_format}")
     
     async def send_audio(self, audio_data: bytes) -> bool:
         """Send audio data to OpenAI"""
-        if not self.is_connected or not self.session_configured:
-            self.log_warning(f"❌ Cannot send audio for {self.device_id}: connected={self.is_connected}, configured={self.session_configured}")
+        state = self._state
+        if state != _READY:
+            if not state & _CONNECTED:
+                self.log_warning(f"❌ Cannot send audio for {self.device_id}: not connected")
+                return False
+            
+            # Hold audio until the session is configured
+            self.last_activity = time.monotonic()
+            self.pending_audio_queue.append(audio_data)
+            return True
+        
+        self.last_activity = time.monotonic()
+        
+        # Stale audio is worth less than low latency once the send backs up.
+        # The cap is checked here rather than set as the queue's maxsize so
+        # control messages and the flush timer can always be queued.
+        if self._queued_audio >= self.max_queued_audio:
+            self.drops += 1
+            return False
+        
+        # The sender task does the encoding and the network write
+        self._queued_audio += 1
+        self._send_queue.put_nowait(audio_data)
+        return True
+    
+    async def _sender_loop(self):
+        """Write audio and control messages in order, coalescing the audio"""
+        queue = self._send_queue
+        get = queue.get
+        get_nowait = queue.get_nowait
+        wake = queue.put_nowait
+        call_later = asyncio.get_running_loop().call_later
+        max_delay = self.max_audio_delay_ms / 1000
+        
+        try:
+            while self._state & _CONNECTED:
+                item = await get()
+                if not self._state & _CONNECTED:
+                    break
+                timer_fired = False
+                
+                # Take everything that arrived while the last send was in flight
+                while True:
+                    if item is None:
+                        # The latency timer fired: send whatever is held
+                        self._flush_timer = None
+                        timer_fired = True
+                    elif type(item) is tuple:
+                        # Control message: audio queued before it goes first
+                        await self._flush_audio_buffer()
+                        await self._write_control(*item)
+                    else:
+                        self._queued_audio -= 1
+                        self._buffer_audio(item)
+                    
+                    if queue.empty():
+                        break
+                    item = get_nowait()
+                
+                if timer_fired or self._write_pos >= self._min_bytes:
+                    await self._flush_audio_buffer()
+                elif self._write_pos and self._flush_timer is None:
+                    self._flush_timer = call_later(max_delay, wake, None)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log_error(f"Sender loop error for {self.device_id}: {e}")
+        finally:
+            self._drain_send_queue()
+    
+    def _drain_send_queue(self):
+        """Discard queued audio and fail any control message still waiting"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        queue = self._send_queue
+        if queue is not None:
+            while not queue.empty():
+                item = queue.get_nowait()
+                if type(item) is tuple and not item[1].done():
+                    item[1].set_result(False)
+        self._queued_audio = 0
+    
+    async def _write_control(self, frame: str, done: asyncio.Future):
+        """Write a queued control message and report the outcome to its sender"""
+        sent = False
+        try:
+            await self.websocket.send(frame)
+            sent = True
+        except Exception as e:
+            self.log_error(f"❌ Failed to send control message for {self.device_id}: {e}")
+        finally:
+            # The waiter may have been cancelled meanwhile
+            if not done.done():
+                done.set_result(sent)
+    
+    async def _send_control(self, frame: str) -> bool:
+        """Queue a control message behind any pending audio and wait for it"""
+        if self._sender_task is None or self._sender_task.done():
             return False
+        done = asyncio.get_running_loop().create_future()
+        self._send_queue.put_nowait((frame, done))
+        return await done
+    
+    async def _process_queued_audio(self):
+        """Flush audio queued before session configuration as a single append"""
+        if not self.pending_audio_queue:
+            return
+        
+        # One encode and one send for the whole backlog instead of one per chunk
+        chunk_count = len(self.pending_audio_queue)
+        merged = b"".join(self.pending_audio_queue)
+        self.pending_audio_queue.clear()
+        
+        self._buffer_audio(merged)
+        if await self._flush_audio_buffer():
+            self.log_info(f"📦 Flushed {chunk_count} queued audio chunks for {self.device_id}: {len(merged)} bytes")
+    
+    def _buffer_audio(self, audio_data: bytes):
+        """Copy audio into the preallocated send buffer"""
+        end = self._write_pos + len(audio_data)
+        if end > len(self.audio_buffer):
+            # Only oversized writes (e.g. a queued backlog) ever grow it
+            self.audio_buffer.extend(bytes(end - len(self.audio_buffer)))
+        self.audio_buffer[self._write_pos:end] = audio_data
+        self._write_pos = end
+    
+    async def _flush_audio_buffer(self) -> bool:
+        """Encode and send buffered audio as an input_audio_buffer.append message"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._write_pos:
+            return True
         
         try:
-            self.log_info(f"🎵 Encoding {len(audio_data)} bytes for OpenAI ({self.device_id})")
+            size = self._write_pos
             
-            # Encode to base64
-            audio_b64 = base64.b64encode(audio_data).decode('utf-8')
+            # Encode to base64 straight from the buffer, without copying it out
+            with memoryview(self.audio_buffer) as view:
+                audio_b64 = _b64encode(view[:size])
+            self._write_pos = 0
             
             # Send as input_audio_buffer.append
-            message = {
-                "type": "input_audio_buffer.append",
-                "audio": audio_b64
-            }
-            
-            await self.websocket.send(json.dumps(message))
-            self.log_info(f"✅ Sent audio to OpenAI for {self.device_id}: {len(audio_data)} bytes")
+            await self.websocket.send(f"{_APPEND_PREFIX}{audio_b64.decode('ascii')}{_APPEND_SUFFIX}")
+            self._bytes_out += size
             return True
             
         except Exception as e:
+            self._write_pos = 0
             self.log_error(f"❌ Failed to send audio for {self.device_id}: {e}")
             return False
     
     async def commit_audio_buffer(self):
         """Manually commit the audio buffer to trigger response generation"""
-        if not self.is_connected or not self.session_configured:
+        if self._state != _READY:
             return False
         
-        try:
-            message = {
-                "type": "input_audio_buffer.commit"
-            }
-            await self.websocket.send(json.dumps(message))
-            self.log_info(f"🎯 Audio buffer committed for {self.device_id}")
-            return True
-        except Exception as e:
-            self.log_error(f"❌ Failed to commit audio buffer for {self.device_id}: {e}")
+        # Goes through the sender, so every chunk sent before it is included
+        if not await self._send_control(_COMMIT_MESSAGE):
+            self.log_error(f"❌ Failed to commit audio buffer for {self.device_id}")
             return False
+        self.log_info(f"🎯 Audio buffer committed for {self.device_id}")
+        return True
     
     async def create_response(self):
         """Manually trigger response creation"""
-        if not self.is_connected or not self.session_configured:
+        if self._state != _READY:
             return False
         
-        try:
-            message = {
-                "type": "response.create",
-                "response": {
-                    "modalities": ["text", "audio"],
-                    "instructions": "Please respond with both text and audio. Provide a helpful and engaging response.",
-                }
-            }
-            await self.websocket.send(json.dumps(message))
-            self.log_info(f"🚀 Response creation triggered for {self.device_id}")
-            return True
-        except Exception as e:
-            self.log_error(f"❌ Failed to create response for {self.device_id}: {e}")
+        if not await self._send_control(_RESPONSE_CREATE_MESSAGE):
+            self.log_error(f"❌ Failed to create response for {self.device_id}")
             return False
+        self.log_info(f"🚀 Response creation triggered for {self.device_id}")
+        return True
     
     async def close(self):
         """Close the connection"""
-        self.is_connected = False
+        self._state = 0
+        
+        # Stop the connection's tasks before the socket goes away, so the
+        # listener ends by cancellation rather than failing on a closing websocket
+        current = asyncio.current_task()
+        tasks = [
+            task for task in (self._listen_task, self._sender_task,
+                              self._playback_task, self._stats_task)
+            if task is not None and task is not current
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Release anyone still waiting on a queued control message
+        self._drain_send_queue()
+        
+        self.pending_audio_queue.clear()
+        self._write_pos = 0
         if self.websocket:
             try:
                 await self.websocket.close()
@@ -231,84 +735,201 @@ class OpenAIConnection(LoggerMixin):
                 self.log_warning(f"⚠️ Error closing OpenAI websocket for {self.device_id}: {e}")
 
 
+# Event type -> handler, built once for all connections and looked up once
+# per incoming message. Hottest type first.
+_HANDLERS = {
+    'response.audio.delta': OpenAIConnection._on_audio_delta,
+    'response.audio_transcript.delta': OpenAIConnection._on_transcript_delta,
+    'session.created': OpenAIConnection._on_session_created,
+    'session.updated': OpenAIConnection._on_session_updated,
+    'input_audio_buffer.speech_started': OpenAIConnection._on_speech_started,
+    'input_audio_buffer.speech_stopped': OpenAIConnection._on_speech_stopped,
+    'response.created': OpenAIConnection._on_response_created,
+    'response.output_item.added': OpenAIConnection._on_output_item_added,
+    'response.content_part.added': OpenAIConnection._on_content_part_added,
+    'response.audio.done': OpenAIConnection._on_audio_done,
+    'response.done': OpenAIConnection._on_response_done,
+    'error': OpenAIConnection._on_error,
+    'conversation.item.created': OpenAIConnection._on_conversation_item_created,
+    'conversation.item.input_audio_transcription.completed': OpenAIConnection._on_transcription_completed,
+}
+
+
+# The registry is split into shards so a copy-on-write update copies only
+# one shard, not every connection in the process. Must be a power of two.
+_SHARD_COUNT = 16
+_SHARD_MASK = _SHARD_COUNT - 1
+
+
+class _ConnectionsView(Mapping):
+    """Read-only mapping over the sharded connection registry"""
+    
+    __slots__ = ('_shards',)
+    
+    def __init__(self, shards: List[Dict[str, 'OpenAIConnection']]):
+        self._shards = shards
+    
+    def __getitem__(self, device_id: str) -> 'OpenAIConnection':
+        return self._shards[hash(device_id) & _SHARD_MASK][device_id]
+    
+    def __contains__(self, device_id) -> bool:
+        return device_id in self._shards[hash(device_id) & _SHARD_MASK]
+    
+    def __iter__(self):
+        for shard in tuple(self._shards):
+            yield from shard
+    
+    def __len__(self) -> int:
+        return sum(map(len, self._shards))
+
+
 class OpenAIService(LoggerMixin):
     """Fixed OpenAI service - RACE CONDITION SAFE"""
     
     def __init__(self, api_key: str):
         super().__init__()
         self.api_key = api_key
-        self.active_connections = {}
+        self.log_info(f"🔤 Audio base64 codec: {_B64_CODEC}")
+        # Copy-on-write shards: mutations swap in a new dict for one shard
+        # (with no await in between, so they're atomic on the loop) and
+        # readers never lock
+        self._shards: List[Dict[str, OpenAIConnection]] = [{} for _ in range(_SHARD_COUNT)]
+        self._connections_view = _ConnectionsView(self._shards)
+        
+        # Idle connection sweep
+        self.idle_timeout = 600  # Close connections idle for 10 minutes
+        self.sweep_interval = 30
+        self._sweep_task: Optional[asyncio.Task] = None
+    
+    @property
+    def active_connections(self) -> Mapping:
+        """Read-only view of current connections, keyed by device ID"""
+        return self._connections_view
+    
+    def _get(self, device_id: str) -> Optional[OpenAIConnection]:
+        """Look up a device's connection"""
+        return self._shards[hash(device_id) & _SHARD_MASK].get(device_id)
+    
+    def _register(self, device_id: str, connection: OpenAIConnection) -> Optional[OpenAIConnection]:
+        """Store a connection, returning the one it replaced"""
+        index = hash(device_id) & _SHARD_MASK
+        shard = self._shards[index]
+        self._shards[index] = {**shard, device_id: connection}
+        return shard.get(device_id)
+    
+    def _unregister(self, device_id: str) -> Optional[OpenAIConnection]:
+        """Remove and return a device's connection"""
+        index = hash(device_id) & _SHARD_MASK
+        shard = self._shards[index]
+        connection = shard.get(device_id)
+        if connection is not None:
+            self._shards[index] = {k: v for k, v in shard.items() if k != device_id}
+        return connection
     
     async def create_connection(self, device_id: str, system_prompt: str,
-                              audio_callback: Callable[[str, bytes], None]) -> OpenAIConnection:
+                              audio_callback: AudioCallback,
+                              raw_audio: bool = True,
+                              output_audio_format: str = "pcm16") -> OpenAIConnection:
         """Create new OpenAI connection"""
         # FIXED: Close existing connection safely
-        if device_id in self.active_connections:
-            await self.close_connection(device_id)
+        existing = self._unregister(device_id)
+        if existing:
+            await existing.close()
         
         connection = OpenAIConnection(
             device_id=device_id,
             system_prompt=system_prompt,
             api_key=self.api_key,
-            audio_callback=audio_callback
+            audio_callback=audio_callback,
+            raw_audio=raw_audio,
+            output_audio_format=output_audio_format
         )
         
         await connection.connect()
-        self.active_connections[device_id] = connection
+        
+        # A concurrent create for the same device may have finished first
+        replaced = self._register(device_id, connection)
+        if replaced is not None and replaced is not connection:
+            await replaced.close()
+        
+        # Started lazily - the service is built before the event loop runs
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._idle_sweep_loop())
+        
         return connection
     
+    async def _idle_sweep_loop(self):
+        """Periodically close connections with no traffic in either direction"""
+        while self._connections_view:
+            try:
+                await asyncio.sleep(self.sweep_interval)
+                
+                cutoff = time.monotonic() - self.idle_timeout
+                idle_devices = [
+                    device_id for shard in tuple(self._shards)
+                    for device_id, connection in shard.items()
+                    if connection.last_activity < cutoff
+                ]
+                for device_id in idle_devices:
+                    self.log_warning(f"🕐 Closing idle OpenAI connection for {device_id}")
+                    await self.close_connection(device_id)
+                    
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.log_error(f"❌ Idle sweep error: {e}")
+    
     async def send_audio(self, device_id: str, audio_data: bytes) -> bool:
         """Send audio to OpenAI"""
-        if device_id not in self.active_connections:
+        connection = self._get(device_id)
+        if connection is None:
             return False
-        return await self.active_connections[device_id].send_audio(audio_data)
+        return await connection.send_audio(audio_data)
     
     async def commit_audio_buffer(self, device_id: str) -> bool:
         """Commit audio buffer for a device"""
-        if device_id not in self.active_connections:
+        connection = self._get(device_id)
+        if connection is None:
             return False
-        return await self.active_connections[device_id].commit_audio_buffer()
+        return await connection.commit_audio_buffer()
     
     async def create_response(self, device_id: str) -> bool:
         """Trigger response creation for a device"""
-        if device_id not in self.active_connections:
+        connection = self._get(device_id)
+        if connection is None:
             return False
-        return await self.active_connections[device_id].create_response()
+        return await connection.create_response()
     
     async def close_connection(self, device_id: str):
         """Close connection - FIXED to handle KeyError gracefully"""
-        if device_id in self.active_connections:
-            try:
-                await self.active_connections[device_id].close()
-                del self.active_connections[device_id]
-                self.log_info(f"✅ Closed OpenAI connection for {device_id}")
-            except KeyError:
-                # Connection was already removed by another call
-                self.log_warning(f"⚠️ OpenAI connection for {device_id} already removed")
-            except Exception as e:
-                self.log_error(f"❌ Error closing OpenAI connection for {device_id}: {e}")
-                # Still try to remove from active_connections
-                try:
-                    del self.active_connections[device_id]
-                except KeyError:
-                    pass
+        connection = self._unregister(device_id)
+        if connection is None:
+            return
+        
+        try:
+            await connection.close()
+            self.log_info(f"✅ Closed OpenAI connection for {device_id}")
+        except Exception as e:
+            self.log_error(f"❌ Error closing OpenAI connection for {device_id}: {e}")
+    
+    async def _close_shard(self, shard: Dict[str, OpenAIConnection]):
+        """Close every connection in one shard snapshot"""
+        for device_id in shard:
+            await self.close_connection(device_id)
     
     async def close_all_connections(self):
         """Close all connections"""
-        # Create a list of device_ids to avoid dictionary changed during iteration
-        device_ids = list(self.active_connections.keys())
-        for device_id in device_ids:
-            await self.close_connection(device_id)
-
+        # Shards are closed concurrently; each shard dict is never mutated
+        # in place, so it can be iterated while its devices are removed
+        await asyncio.gather(*(self._close_shard(shard) for shard in tuple(self._shards)))
+        
+        if self._sweep_task:
+            self._sweep_task.cancel()
 
-# Global instance
-_openai_service: Optional[OpenAIService] = None
 
+# Global OpenAI service instance, created on first call
+@functools.lru_cache(maxsize=None)
 def get_openai_service() -> OpenAIService:
     """Get OpenAI service singleton"""
-    global _openai_service
-    if _openai_service is None:
-        from config.settings import get_settings
-        settings = get_settings()
-        _openai_service = OpenAIService(settings.openai_api_key)
-    return _openai_service
\ No newline at end of file
+    settings = get_settings()
+    return OpenAIService(settings.openai_api_key)
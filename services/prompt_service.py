@@ -1,9 +1,14 @@
 """
 System prompt service for handling prompt-related business logic
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import functools
+import re
+import time
+from typing import List, Dict, Any, Tuple
 from datetime import datetime
 
+from config.settings import get_settings
 from models.system_prompt import (
     SystemPrompt, SystemPromptRequest, SystemPromptResponse, 
     PromptValidationResult, PromptType, SeasonOverview
@@ -14,12 +19,78 @@ from utils.validators import PromptValidator
 from utils.logger import LoggerMixin, log_system_prompt_upload
 
 
+# Quality-suggestion keyword groups, one compiled alternation per group so
+# each check is a single scan. Substring matching as before ("learning"
+# counts for "learn").
+_LEARNING_KEYWORDS = re.compile('learn|practice|exercise|lesson|teach')
+_ENGAGEMENT_KEYWORDS = re.compile('fun|engaging|interactive|encouraging')
+_HELP_KEYWORDS = re.compile('help|assist')
+_AGE_KEYWORDS = re.compile('age|level')
+
+# PromptValidator issues that make a prompt invalid; anything else it
+# reports is only a suggestion
+_ERROR_ISSUES = re.compile(
+    'cannot be empty|should be at least|should not exceed|'
+    'inappropriate content|template placeholders'
+)
+
+
 class PromptService(LoggerMixin):
     """Service for system prompt operations"""
     
     def __init__(self):
         super().__init__()
         self.firebase_service = get_firebase_service()
+        
+        # Prompts rarely change and are read on every device connect, so
+        # reads are served from memory. Past prompt_cache_ttl seconds the
+        # cached copy is still returned while a background task re-reads it,
+        # but never once it is more than twice that old: then the read waits
+        # on Firestore, so edits made elsewhere (another worker, the console)
+        # show up within 2 * prompt_cache_ttl. Writes through this service
+        # drop the affected entry immediately.
+        self.prompt_cache_ttl = 300
+        self._prompt_cache: Dict[Tuple[int, int], Tuple[float, SystemPrompt]] = {}
+        self._refresh_tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+    
+    async def _get_prompt(self, season: int, episode: int) -> SystemPrompt:
+        """Get a prompt from the cache, fetching it from Firebase when missing or too stale"""
+        key = (season, episode)
+        cached = self._prompt_cache.get(key)
+        now = time.monotonic()
+        if cached is None or cached[0] + self.prompt_cache_ttl <= now:
+            return await self._fetch_prompt(season, episode)
+        
+        if cached[0] <= now and key not in self._refresh_tasks:
+            task = asyncio.create_task(self._refresh_prompt(season, episode))
+            self._refresh_tasks[key] = task
+            task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+        return cached[1]
+    
+    async def _fetch_prompt(self, season: int, episode: int) -> SystemPrompt:
+        """Read a prompt from Firebase and cache it"""
+        system_prompt = await self.firebase_service.get_system_prompt(season, episode)
+        self._prompt_cache[(season, episode)] = (time.monotonic() + self.prompt_cache_ttl, system_prompt)
+        return system_prompt
+    
+    async def _refresh_prompt(self, season: int, episode: int):
+        """Re-read an expired prompt in the background"""
+        try:
+            await self._fetch_prompt(season, episode)
+        except SystemPromptNotFoundException:
+            self._prompt_cache.pop((season, episode), None)
+        except Exception as e:
+            # Keep serving the cached copy; the next read retries
+            self.log_warning(f"Failed to refresh prompt S{season}E{episode}: {e}")
+    
+    def _invalidate_prompt(self, season: int, episode: int):
+        """Drop a cached prompt after it has been written"""
+        key = (season, episode)
+        self._prompt_cache.pop(key, None)
+        # A refresh that read before the write must not store the old copy
+        task = self._refresh_tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
     
     async def create_system_prompt(self, prompt_request: SystemPromptRequest) -> SystemPromptResponse:
         """
@@ -48,7 +119,7 @@ class PromptService(LoggerMixin):
         
         try:
             # Create prompt in Firebase
-            system_prompt = await self.firebase_service.create_system_prompt(
+            system_prompt, written = await self.firebase_service.create_system_prompt(
                 season=prompt_request.season,
                 episode=prompt_request.episode,
                 prompt=prompt_request.prompt,
@@ -56,6 +127,12 @@ class PromptService(LoggerMixin):
                 metadata=prompt_request.metadata
             )
             
+            if not written:
+                self.log_info(f"System prompt unchanged: Season {prompt_request.season}, Episode {prompt_request.episode}")
+                return SystemPromptResponse.from_system_prompt(system_prompt)
+            
+            self._invalidate_prompt(prompt_request.season, prompt_request.episode)
+            
             # Log upload
             log_system_prompt_upload(prompt_request.season, prompt_request.episode, len(prompt_request.prompt))
             
@@ -87,8 +164,8 @@ class PromptService(LoggerMixin):
         if not is_valid:
             raise ValidationException(error_msg, "season_episode")
         
-        # Get prompt from Firebase
-        system_prompt = await self.firebase_service.get_system_prompt(season, episode)
+        # Get prompt from the cache or Firebase
+        system_prompt = await self._get_prompt(season, episode)
         return SystemPromptResponse.from_system_prompt(system_prompt)
     
     async def get_prompt_content(self, season: int, episode: int) -> str:
@@ -102,7 +179,7 @@ class PromptService(LoggerMixin):
         Returns:
             str: Raw prompt content
         """
-        system_prompt = await self.firebase_service.get_system_prompt(season, episode)
+        system_prompt = await self._get_prompt(season, episode)
         return system_prompt.prompt
     
     async def get_season_overview(self, season: int) -> SeasonOverview:
@@ -115,29 +192,31 @@ class PromptService(LoggerMixin):
         Returns:
             SeasonOverview: Season information
         """
-        from config.settings import get_settings
         settings = get_settings()
         
         # Get all prompts for the season
         prompts = await self.firebase_service.get_all_prompts_for_season(season)
-        
-        # Calculate statistics
-        total_episodes = settings.episodes_per_season
-        completed_episodes = len(prompts)
-        
-        # Get unique prompt types
-        prompt_types = list(set([prompt.prompt_type.value for prompt in prompts]))
-        
-        # Find last updated prompt
+        return self._build_season_overview(season, prompts, settings.episodes_per_season)
+    
+    def _build_season_overview(self, season: int, prompts: List[SystemPrompt],
+                               total_episodes: int) -> SeasonOverview:
+        """Aggregate a season's prompts into its overview"""
+        # Unique prompt types and the latest update, in one pass
+        prompt_types = set()
         last_updated = None
-        if prompts:
-            last_updated = max([prompt.updated_at for prompt in prompts if prompt.updated_at])
-        
-        return SeasonOverview(
+        for prompt in prompts:
+            # Already the plain string: SystemPrompt stores enum values
+            prompt_types.add(prompt.prompt_type)
+            updated_at = prompt.updated_at
+            if updated_at and (last_updated is None or updated_at > last_updated):
+                last_updated = updated_at
+        
+        # Built from already-validated prompts, so validation is skipped
+        return SeasonOverview.model_construct(
             season=season,
             total_episodes=total_episodes,
-            completed_episodes=completed_episodes,
-            available_prompt_types=prompt_types,
+            completed_episodes=len(prompts),
+            available_prompt_types=list(prompt_types),
             last_updated=last_updated
         )
     
@@ -148,24 +227,26 @@ class PromptService(LoggerMixin):
         Returns:
             List[SeasonOverview]: List of season overviews
         """
-        from config.settings import get_settings
         settings = get_settings()
         
+        # One query for every season instead of one per season
+        try:
+            prompts_by_season = await self.firebase_service.get_all_prompts_grouped_by_season()
+        except Exception as e:
+            self.log_warning(f"Failed to get prompts for season overview: {e}")
+            prompts_by_season = {}
+        
         overviews = []
         for season in range(1, settings.max_seasons + 1):
             try:
-                overview = await self.get_season_overview(season)
-                overviews.append(overview)
+                overview = self._build_season_overview(
+                    season, prompts_by_season.get(season, []), settings.episodes_per_season
+                )
             except Exception as e:
                 self.log_warning(f"Failed to get overview for season {season}: {e}")
-                # Create empty overview for missing seasons
-                overviews.append(SeasonOverview(
-                    season=season,
-                    total_episodes=settings.episodes_per_season,
-                    completed_episodes=0,
-                    available_prompt_types=[],
-                    last_updated=None
-                ))
+                # One bad season gets an empty overview rather than failing the rest
+                overview = self._build_season_overview(season, [], settings.episodes_per_season)
+            overviews.append(overview)
         
         return overviews
     
@@ -179,44 +260,53 @@ class PromptService(LoggerMixin):
         Returns:
             PromptValidationResult: Validation result with errors and suggestions
         """
+        # Prompts are re-validated on every analytics request but rarely
+        # change, so the outcome is cached by content. Each caller still
+        # gets its own result object, since results are mutable.
+        is_valid, errors, suggestions = self._validate_cached(prompt)
+        return PromptValidationResult(
+            is_valid=is_valid, errors=list(errors), suggestions=list(suggestions)
+        )
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _validate_cached(prompt: str) -> Tuple[bool, Tuple[str, ...], Tuple[str, ...]]:
+        """Validate prompt content, returning (is_valid, errors, suggestions)"""
         is_valid, issues = PromptValidator.validate_prompt_content(prompt)
         
         result = PromptValidationResult(is_valid=is_valid)
         
         # Categorize issues
         for issue in issues:
-            if "cannot be empty" in issue or "should be at least" in issue or "should not exceed" in issue:
-                result.add_error(issue)
-            elif "inappropriate content" in issue or "template placeholders" in issue:
+            if _ERROR_ISSUES.search(issue):
                 result.add_error(issue)
             else:
                 result.add_suggestion(issue)
         
         # Add additional suggestions for improvement
-        self._add_quality_suggestions(prompt, result)
+        PromptService._add_quality_suggestions(prompt, result)
         
-        return result
+        return result.is_valid, tuple(result.errors), tuple(result.suggestions)
     
-    def _add_quality_suggestions(self, prompt: str, result: PromptValidationResult):
+    @staticmethod
+    def _add_quality_suggestions(prompt: str, result: PromptValidationResult):
         """Add quality improvement suggestions"""
         prompt_lower = prompt.lower()
         
         # Check for learning-specific keywords
-        learning_keywords = ['learn', 'practice', 'exercise', 'lesson', 'teach']
-        if not any(keyword in prompt_lower for keyword in learning_keywords):
+        if not _LEARNING_KEYWORDS.search(prompt_lower):
             result.add_suggestion("Consider adding learning-focused language (learn, practice, etc.)")
         
         # Check for engagement elements
-        engagement_keywords = ['fun', 'engaging', 'interactive', 'encouraging']
-        if not any(keyword in prompt_lower for keyword in engagement_keywords):
+        if not _ENGAGEMENT_KEYWORDS.search(prompt_lower):
             result.add_suggestion("Consider adding engaging elements to make learning more interactive")
         
         # Check for clear instructions
-        if 'help' not in prompt_lower and 'assist' not in prompt_lower:
+        if not _HELP_KEYWORDS.search(prompt_lower):
             result.add_suggestion("Consider explicitly stating how you will help the user")
         
         # Check for age-appropriate language guidance
-        if 'age' not in prompt_lower and 'level' not in prompt_lower:
+        if not _AGE_KEYWORDS.search(prompt_lower):
             result.add_suggestion("Consider mentioning age-appropriate communication")
     
     async def update_prompt_metadata(self, season: int, episode: int, 
@@ -238,17 +328,18 @@ class PromptService(LoggerMixin):
         # Merge metadata
         updated_metadata = {**existing_prompt.metadata, **metadata}
         
-        # Create updated prompt
-        updated_prompt = await self.firebase_service.create_system_prompt(
-            season=season,
-            episode=episode,
-            prompt=existing_prompt.prompt,
-            prompt_type=existing_prompt.prompt_type,
-            metadata=updated_metadata
+        # Write only the metadata map; the prompt text is left untouched
+        await self.firebase_service.update_system_prompt(
+            season, episode, {"metadata": updated_metadata}
         )
+        self._invalidate_prompt(season, episode)
+        
+        existing_prompt.metadata = updated_metadata
+        existing_prompt.version += 1
+        existing_prompt.updated_at = datetime.now()
         
         self.log_info(f"Prompt metadata updated: Season {season}, Episode {episode}")
-        return SystemPromptResponse.from_system_prompt(updated_prompt)
+        return SystemPromptResponse.from_system_prompt(existing_prompt)
     
     async def deactivate_prompt(self, season: int, episode: int) -> bool:
         """
@@ -262,23 +353,12 @@ class PromptService(LoggerMixin):
             bool: True if deactivated successfully
         """
         try:
-            # Get existing prompt
-            existing_prompt = await self.firebase_service.get_system_prompt(season, episode)
-            
-            # Update with deactivated status
-            deactivated_metadata = {
-                **existing_prompt.metadata,
-                "deactivated_at": datetime.now().isoformat(),
-                "is_active": False
-            }
-            
-            await self.firebase_service.create_system_prompt(
-                season=season,
-                episode=episode,
-                prompt=existing_prompt.prompt,
-                prompt_type=existing_prompt.prompt_type,
-                metadata=deactivated_metadata
-            )
+            # Set the deactivated status in place, without reading the prompt
+            await self.firebase_service.update_system_prompt(season, episode, {
+                "metadata.deactivated_at": datetime.now().isoformat(),
+                "metadata.is_active": False
+            })
+            self._invalidate_prompt(season, episode)
             
             self.log_info(f"Prompt deactivated: Season {season}, Episode {episode}")
             return True
@@ -306,10 +386,13 @@ class PromptService(LoggerMixin):
         prompts = []
         
         if season:
-            # Get all prompts for specific season
-            season_prompts = await self.firebase_service.get_all_prompts_for_season(season)
+            # Get the season's prompts, filtered by type in Firestore
+            season_prompts = await self.firebase_service.get_all_prompts_for_season(
+                season, prompt_type=prompt_type
+            )
+            query_lower = query.lower() if query else None
             for prompt in season_prompts:
-                if self._matches_search_criteria(prompt, query, prompt_type):
+                if query_lower is None or query_lower in prompt.prompt.lower():
                     prompts.append(SystemPromptResponse.from_system_prompt(prompt))
         else:
             # Would need to implement cross-season search
@@ -317,16 +400,12 @@ class PromptService(LoggerMixin):
         
         return prompts
     
-    def _matches_search_criteria(self, prompt: SystemPrompt, query: str = None, 
-                                prompt_type: PromptType = None) -> bool:
-        """Check if prompt matches search criteria"""
-        if prompt_type and prompt.prompt_type != prompt_type:
-            return False
-        
-        if query and query.lower() not in prompt.prompt.lower():
-            return False
-        
-        return True
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _count_content(content: str) -> Tuple[int, int]:
+        """Word and line counts for prompt content, cached by content"""
+        # Only the word count needs a split
+        return len(content.split()), content.count('\n') + 1
     
     async def get_prompt_analytics(self, season: int, episode: int) -> Dict[str, Any]:
         """
@@ -339,38 +418,44 @@ class PromptService(LoggerMixin):
         Returns:
             Dict[str, Any]: Prompt analytics
         """
-        prompt = await self.firebase_service.get_system_prompt(season, episode)
+        prompt = await self._get_prompt(season, episode)
+        
+        content = prompt.prompt
+        word_count, line_count = self._count_content(content)
+        # Same fields as PromptValidationResult.dict(), without building
+        # the model only to serialise it again
+        is_valid, errors, suggestions = self._validate_cached(content)
         
         return {
             "prompt_info": {
                 "season": prompt.season,
                 "episode": prompt.episode,
-                "prompt_type": prompt.prompt_type.value,
+                "prompt_type": prompt.prompt_type,
                 "version": prompt.version,
                 "is_active": prompt.is_active
             },
             "content_analysis": {
-                "character_count": len(prompt.prompt),
-                "word_count": len(prompt.prompt.split()),
-                "line_count": len(prompt.prompt.split('\n')),
-                "avg_words_per_line": len(prompt.prompt.split()) / max(len(prompt.prompt.split('\n')), 1)
+                "character_count": len(content),
+                "word_count": word_count,
+                "line_count": line_count,
+                "avg_words_per_line": word_count / line_count
             },
             "timestamps": {
                 "created_at": prompt.created_at.isoformat() if prompt.created_at else None,
                 "updated_at": prompt.updated_at.isoformat() if prompt.updated_at else None
             },
             "metadata": prompt.metadata,
-            "validation": self.validate_prompt_content(prompt.prompt).dict()
+            "validation": {
+                "is_valid": is_valid,
+                "errors": list(errors),
+                "warnings": [],
+                "suggestions": list(suggestions)
+            }
         }
 
 
-# Global prompt service instance
-_prompt_service: Optional[PromptService] = None
-
-
+# Global prompt service instance, created on first call
+@functools.lru_cache(maxsize=None)
 def get_prompt_service() -> PromptService:
     """Get prompt service singleton"""
-    global _prompt_service
-    if _prompt_service is None:
-        _prompt_service = PromptService()
-    return _prompt_service
\ No newline at end of file
+    return PromptService()
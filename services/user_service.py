@@ -4,11 +4,12 @@ User service for handling user-related business logic
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+from config.settings import get_settings
 from models.user import User, UserProgress, UserRegistrationRequest, UserResponse, SessionInfo
 from services.firebase_service import get_firebase_service
 from utils.exceptions import UserAlreadyExistsException, UserNotFoundException, ValidationException
 from utils.validators import UserValidator, DeviceValidator
-from utils.logger import LoggerMixin, log_user_registration
+from utils.logger import LoggerMixin, log_user_registration, log_user_progress
 
 
 class UserService(LoggerMixin):
@@ -17,6 +18,11 @@ class UserService(LoggerMixin):
     def __init__(self):
         super().__init__()
         self.firebase_service = get_firebase_service()
+        self.settings = get_settings()
+        
+        # Fixed for the life of the process
+        self.episodes_per_season = self.settings.episodes_per_season
+        self.total_possible_episodes = self.settings.max_seasons * self.episodes_per_season
     
     async def register_user(self, registration_data: UserRegistrationRequest) -> UserResponse:
         """
@@ -103,24 +109,10 @@ class UserService(LoggerMixin):
         Returns:
             UserResponse: Updated user information
         """
-        # Get current user
-        user = await self.firebase_service.get_user(device_id)
-        
-        # Update progress
-        if words_learnt:
-            # Add new words (avoid duplicates)
-            existing_words = set(user.progress.words_learnt)
-            new_words = [word for word in words_learnt if word not in existing_words]
-            user.progress.words_learnt.extend(new_words)
-        
-        if topics_learnt:
-            # Add new topics (avoid duplicates)
-            existing_topics = set(user.progress.topics_learnt)
-            new_topics = [topic for topic in topics_learnt if topic not in existing_topics]
-            user.progress.topics_learnt.extend(new_topics)
-        
-        # Update in Firebase
-        updated_user = await self.firebase_service.update_user_progress(device_id, user.progress)
+        # Duplicates are skipped by Firestore, without reading the lists first
+        updated_user = await self.firebase_service.append_user_progress(
+            device_id, words_learnt, topics_learnt
+        )
         
         self.log_info(f"Progress updated for user {device_id}")
         return UserResponse.from_user(updated_user)
@@ -135,28 +127,17 @@ class UserService(LoggerMixin):
         Returns:
             UserResponse: Updated user information
         """
-        from config.settings import get_settings
-        settings = get_settings()
-        
-        # Get current user
-        user = await self.firebase_service.get_user(device_id)
-        
-        # Store old progress for logging
-        old_progress = user.progress.dict()
-        
-        # Advance episode
-        advanced_to_new_season = user.progress.advance_episode(settings.episodes_per_season)
-        
-        # Update in Firebase
-        updated_user = await self.firebase_service.update_user_progress(device_id, user.progress)
+        # Read, advance and write back atomically
+        old_progress, user = await self.firebase_service.advance_user_episode(
+            device_id, self.episodes_per_season
+        )
         
         # Log progress update
-        from utils.logger import log_user_progress
         log_user_progress(device_id, old_progress, user.progress.dict())
         
         self.log_info(f"Episode advanced for user {device_id} - Season {user.progress.season}, Episode {user.progress.episode}")
         
-        return UserResponse.from_user(updated_user)
+        return UserResponse.from_user(user)
     
     async def get_user_session_info(self, device_id: str, session_duration: float = 0.0,
                                   is_connected: bool = False, is_openai_connected: bool = False) -> SessionInfo:
@@ -196,13 +177,14 @@ class UserService(LoggerMixin):
             Dict[str, Any]: User statistics
         """
         user = await self.firebase_service.get_user(device_id)
+        average_session_time = user.progress.average_session_time
         
         return {
             "user_info": {
                 "device_id": user.device_id,
                 "name": user.name,
                 "age": user.age,
-                "status": user.status.value,
+                "status": user.status,
                 "created_at": user.created_at.isoformat() if user.created_at else None,
                 "last_active": user.last_active.isoformat() if user.last_active else None
             },
@@ -218,38 +200,27 @@ class UserService(LoggerMixin):
             "time_statistics": {
                 "total_time_seconds": user.progress.total_time,
                 "total_time_hours": round(user.progress.total_time / 3600, 2),
-                "average_session_time": self._calculate_average_session_time(user),
+                "average_session_time": average_session_time,
                 "last_completed_episode": user.last_completed_episode.isoformat() if user.last_completed_episode else None
             },
             "completion_stats": {
                 "completion_rate": self._calculate_completion_rate(user),
-                "episodes_remaining_in_season": 7 - user.progress.episode,
-                "estimated_season_completion": self._estimate_completion_time(user)
+                "episodes_remaining_in_season": self.episodes_per_season - user.progress.episode,
+                "estimated_season_completion": self._estimate_completion_time(user, average_session_time)
             }
         }
     
-    def _calculate_average_session_time(self, user: User) -> float:
-        """Calculate average session time for user"""
-        if user.progress.episodes_completed == 0:
-            return 0.0
-        return user.progress.total_time / user.progress.episodes_completed
-    
     def _calculate_completion_rate(self, user: User) -> float:
         """Calculate learning completion rate as percentage"""
-        from config.settings import get_settings
-        settings = get_settings()
-        
-        total_possible_episodes = settings.max_seasons * settings.episodes_per_season
-        completion_percentage = (user.progress.episodes_completed / total_possible_episodes) * 100
+        completion_percentage = (user.progress.episodes_completed / self.total_possible_episodes) * 100
         return round(completion_percentage, 2)
     
-    def _estimate_completion_time(self, user: User) -> Optional[str]:
+    def _estimate_completion_time(self, user: User, avg_time_per_episode: float) -> Optional[str]:
         """Estimate time to complete current season"""
         if user.progress.episodes_completed == 0:
             return None
         
-        avg_time_per_episode = self._calculate_average_session_time(user)
-        episodes_remaining = 7 - user.progress.episode
+        episodes_remaining = self.episodes_per_season - user.progress.episode
         
         estimated_seconds = avg_time_per_episode * episodes_remaining
         estimated_hours = estimated_seconds / 3600
@@ -289,13 +260,8 @@ class UserService(LoggerMixin):
             bool: True if deleted successfully
         """
         try:
-            from models.user import UserStatus
-            
             # Update user status to inactive
-            await self.firebase_service.update_user(device_id, {
-                "status": UserStatus.INACTIVE.value,
-                "deleted_at": datetime.now()
-            })
+            await self.firebase_service.deactivate_user(device_id)
             
             self.log_info(f"User soft deleted: {device_id}")
             return True
@@ -3,16 +3,24 @@ Ultra-Robust WebSocket service that handles client disconnections during setup
 """
 import asyncio
 import json
+import logging
 import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Optional, Set, Union
 from fastapi import WebSocket, WebSocketDisconnect
 
 from services.firebase_service import get_firebase_service
 from services.openai_service import get_openai_service
+from services.prompt_service import get_prompt_service
 from utils.logger import LoggerMixin
 
 
+# Per-chunk audio log formats: ASCII only, formatted lazily at DEBUG level
+_LOG_AUDIO_IN = "Audio from %s: %d bytes"
+_LOG_AUDIO_OUT = "Sent %d bytes of audio to ESP32 %s"
+_DEBUG = logging.DEBUG
+
+
 class WebSocketConnectionManager(LoggerMixin):
     """Ultra-robust WebSocket connection manager"""
     
@@ -20,6 +28,7 @@ class WebSocketConnectionManager(LoggerMixin):
         super().__init__()
         self.firebase_service = get_firebase_service()
         self.openai_service = get_openai_service()
+        self.prompt_service = get_prompt_service()
         
         # Active connections: device_id -> WebSocket
         self.connections: Dict[str, WebSocket] = {}
@@ -34,11 +43,17 @@ class WebSocketConnectionManager(LoggerMixin):
         self.last_activity: Dict[str, float] = {}
         self.last_audio_time: Dict[str, float] = {}
         
+        # Strong references to fire-and-forget tasks so they aren't
+        # garbage collected mid-flight
+        self._bg_tasks: Set[asyncio.Task] = set()
+        
         # Configuration
         self.keepalive_interval = 10  # Send ping every 10 seconds (more frequent)
         self.connection_timeout = 300  # 5 minutes total timeout
         self.activity_timeout = 120   # 2 minutes of inactivity before warning
         self.silence_threshold = 1.0  # 1 second of silence before committing buffer
+        self.forward_base64_audio = False  # True for firmware taking base64 text frames; skips the decode
+        self.esp32_audio_format = "pcm16"  # "g711_ulaw" for firmware that decodes G.711; ~6x less audio out
     
     async def connect_device(self, websocket: WebSocket, device_id: str, remote_addr: str) -> bool:
         """Handle ESP32 device connection with ultra-robust error handling"""
@@ -89,7 +104,7 @@ class WebSocketConnectionManager(LoggerMixin):
                 
                 await self._safe_send_status(device_id, f"Loading Season {user.progress.season}, Episode {user.progress.episode}...")
                 
-                system_prompt_obj = await self.firebase_service.get_system_prompt(
+                system_prompt = await self.prompt_service.get_prompt_content(
                     user.progress.season, user.progress.episode
                 )
                 
@@ -134,12 +149,12 @@ class WebSocketConnectionManager(LoggerMixin):
             )
             
             # Create OpenAI connection in background
-            asyncio.create_task(
-                self._create_openai_connection_async(device_id, system_prompt_obj.prompt)
+            self._spawn(
+                self._create_openai_connection_async(device_id, system_prompt)
             )
             
             # Start silence detection task
-            asyncio.create_task(self._silence_detection_loop(device_id))
+            self._spawn(self._silence_detection_loop(device_id))
             
             # Handle messages with improved error handling
             await self._handle_messages_with_keepalive(websocket, device_id)
@@ -152,6 +167,13 @@ class WebSocketConnectionManager(LoggerMixin):
             
         return True
     
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background without blocking the caller"""
+        task = asyncio.create_task(coro)
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+        return task
+    
     async def _safe_send_message(self, websocket: WebSocket, device_id: str, message: dict) -> bool:
         """Safely send message with connection state checking"""
         try:
@@ -295,7 +317,9 @@ class WebSocketConnectionManager(LoggerMixin):
                 await self.openai_service.create_connection(
                     device_id=device_id,
                     system_prompt=system_prompt,
-                    audio_callback=self._send_audio_to_esp32
+                    audio_callback=self._send_audio_to_esp32,
+                    raw_audio=not self.forward_base64_audio,
+                    output_audio_format=self.esp32_audio_format
                 )
                 self.log_info(f"✅ OpenAI connected for {device_id} on attempt {attempt + 1}")
                 
@@ -344,13 +368,9 @@ class WebSocketConnectionManager(LoggerMixin):
                     # Update activity timestamp
                     self.last_activity[device_id] = time.time()
                     
-                    self.log_info(f"📥 Message from {device_id}: type={message.get('type')}")
-                    
                     if message["type"] == "websocket.receive":
                         if "bytes" in message:
-                            audio_data = message["bytes"]
-                            self.log_info(f"🎵 Audio from {device_id}: {len(audio_data)} bytes")
-                            await self._handle_audio_data(device_id, audio_data)
+                            await self._handle_audio_data(device_id, message["bytes"])
                         
                         elif "text" in message:
                             text_content = message["text"]
@@ -385,7 +405,8 @@ class WebSocketConnectionManager(LoggerMixin):
     
     async def _handle_audio_data(self, device_id: str, audio_data: bytes):
         """Handle audio data"""
-        self.log_info(f"📤 Audio chunk from {device_id}: {len(audio_data)} bytes")
+        if self.logger.isEnabledFor(_DEBUG):
+            self.logger.debug(_LOG_AUDIO_IN, device_id, len(audio_data))
         
         # Update activity and audio timestamps
         current_time = time.time()
@@ -396,7 +417,6 @@ class WebSocketConnectionManager(LoggerMixin):
         if device_id in self.openai_service.active_connections:
             try:
                 await self.openai_service.send_audio(device_id, audio_data)
-                self.log_info(f"✅ Forwarded audio to OpenAI for {device_id}")
             except Exception as e:
                 self.log_warning(f"⚠️ Failed to forward audio to OpenAI for {device_id}: {e}")
     
@@ -469,13 +489,17 @@ class WebSocketConnectionManager(LoggerMixin):
                 }
                 await self._safe_send_message(self.connections[device_id], device_id, pong_response)
     
-    async def _send_audio_to_esp32(self, device_id: str, audio_data: bytes):
+    async def _send_audio_to_esp32(self, device_id: str, audio_data: Union[bytes, str]):
         """Send audio response from OpenAI to ESP32"""
         if device_id in self.connections:
             try:
-                self.log_info(f"🔊 Forwarding {len(audio_data)} bytes of audio to ESP32 {device_id}")
-                await self.connections[device_id].send_bytes(audio_data)
-                self.log_info(f"✅ Successfully sent {len(audio_data)} bytes to ESP32 {device_id}")
+                if isinstance(audio_data, str):
+                    # Still base64-encoded (forward_base64_audio)
+                    await self.connections[device_id].send_text(audio_data)
+                else:
+                    await self.connections[device_id].send_bytes(audio_data)
+                if self.logger.isEnabledFor(_DEBUG):
+                    self.logger.debug(_LOG_AUDIO_OUT, len(audio_data), device_id)
                 self.last_activity[device_id] = time.time()
             except Exception as e:
                 self.log_error(f"❌ Failed to send audio to ESP32 {device_id}: {e}")
@@ -511,20 +535,12 @@ class WebSocketConnectionManager(LoggerMixin):
         except Exception as e:
             self.log_warning(f"⚠️ Error closing OpenAI connection for {device_id}: {e}")
         
-        # Update session time if connection exists
-        if device_id in self.connection_times:
-            try:
-                session_duration = time.time() - self.connection_times[device_id]
-                await self.firebase_service.increment_user_time(device_id, session_duration)
-                self.log_info(f"⏱️ Updated session time for {device_id}: {session_duration:.1f}s")
-                del self.connection_times[device_id]
-            except Exception as e:
-                self.log_warning(f"⚠️ Error updating session time for {device_id}: {e}")
-                # Still try to delete the key
-                try:
-                    del self.connection_times[device_id]
-                except KeyError:
-                    pass
+        # Update session time if connection exists - the Firestore write
+        # runs in the background so cleanup isn't held up by it
+        connection_time = self.connection_times.pop(device_id, None)
+        if connection_time is not None:
+            session_duration = time.time() - connection_time
+            self._spawn(self._record_session_time(device_id, session_duration))
         
         # Clean up all connection data safely
         collections_to_clean = [
@@ -544,6 +560,14 @@ class WebSocketConnectionManager(LoggerMixin):
         
         self.log_info(f"✅ Safe cleanup completed for {device_id}")
     
+    async def _record_session_time(self, device_id: str, session_duration: float):
+        """Persist a finished session's duration"""
+        try:
+            await self.firebase_service.increment_user_time(device_id, session_duration)
+            self.log_info(f"⏱️ Updated session time for {device_id}: {session_duration:.1f}s")
+        except Exception as e:
+            self.log_warning(f"⚠️ Error updating session time for {device_id}: {e}")
+    
     def get_active_connections(self) -> Dict[str, dict]:
         """Get active connection info"""
         current_time = time.time()
@@ -599,6 +623,11 @@ class WebSocketConnectionManager(LoggerMixin):
         if shutdown_tasks:
             await asyncio.gather(*shutdown_tasks, return_exceptions=True)
         
+        # Let pending session-time writes land before the process exits
+        pending_writes = [task for task in self._bg_tasks if not task.done()]
+        if pending_writes:
+            await asyncio.wait(pending_writes, timeout=5)
+        
         self.log_info("✅ WebSocket manager shutdown complete")
     
     async def _graceful_disconnect(self, device_id: str):
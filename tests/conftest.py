@@ -0,0 +1,124 @@
+"""
+Shared fixtures: an in-memory stand-in for the Firestore client
+"""
+import copy
+from datetime import datetime
+
+import pytest
+
+
+class FakeSnapshot:
+    """Minimal DocumentSnapshot"""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    """Minimal DocumentReference over the client's store"""
+
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._key = (collection, doc_id)
+        self.id = doc_id
+
+    def get(self, transaction=None):
+        self._client.reads.append(self._key)
+        return FakeSnapshot(self.id, self._client.store.get(self._key))
+
+    def set(self, data):
+        self._client.writes.append((self._key, data))
+        self._client.store[self._key] = copy.deepcopy(data)
+
+    def update(self, updates):
+        from google.api_core.exceptions import NotFound
+        from google.cloud.firestore_v1.transforms import ArrayUnion, Increment, Sentinel
+
+        document = self._client.store.get(self._key)
+        if document is None:
+            raise NotFound(f"{self._key} not found")
+        self._client.writes.append((self._key, updates))
+
+        for path, value in updates.items():
+            *parents, field = path.split('.')
+            target = document
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            if isinstance(value, ArrayUnion):
+                existing = target.setdefault(field, [])
+                existing.extend(v for v in value.values if v not in existing)
+            elif isinstance(value, Increment):
+                target[field] = target.get(field, 0) + value.value
+            elif isinstance(value, Sentinel):
+                target[field] = datetime.now()
+            else:
+                target[field] = copy.deepcopy(value)
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self._client, self._name, doc_id)
+
+    def get(self):
+        return [
+            FakeSnapshot(doc_id, copy.deepcopy(data))
+            for (collection, doc_id), data in self._client.store.items()
+            if collection == self._name
+        ]
+
+
+class FakeTransaction:
+    """Applies transactional writes immediately"""
+
+    def update(self, reference, updates):
+        reference.update(updates)
+
+
+class FakeFirestore:
+    """In-memory Firestore client recording every read and write"""
+
+    def __init__(self):
+        self.store = {}
+        self.reads = []
+        self.writes = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self):
+        return FakeTransaction()
+
+
+@pytest.fixture
+def firestore_client():
+    return FakeFirestore()
+
+
+@pytest.fixture
+def firebase_service(monkeypatch, firestore_client):
+    """A FirebaseService backed by the in-memory client"""
+    pytest.importorskip("firebase_admin")
+    pytest.importorskip("google.cloud.firestore")
+    pytest.importorskip("pydantic_settings")
+    from firebase_admin import firestore
+    from services.firebase_service import FirebaseService
+
+    monkeypatch.setattr(FirebaseService, "_initialize_firebase", lambda self: None)
+    # The stub client applies writes at once, so there is nothing to retry
+    monkeypatch.setattr(firestore, "transactional", lambda func: func)
+
+    service = FirebaseService()
+    service.db = firestore_client
+    return service
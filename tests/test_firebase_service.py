@@ -0,0 +1,74 @@
+"""
+Tests for FirebaseService's short-lived user cache
+"""
+import pytest
+
+pytest.importorskip("pydantic")
+
+from models.user import User, UserProgress  # noqa: E402
+
+DEVICE_ID = "ABCD1234"
+USER_KEY = ("users", DEVICE_ID)
+
+
+@pytest.fixture
+def stored_user(firebase_service, firestore_client):
+    user = User(device_id=DEVICE_ID, name="Asha", age=8,
+                progress=UserProgress(words_learnt=["hola"]))
+    firestore_client.store[USER_KEY] = firebase_service._user_to_dict(user)
+    return user
+
+
+def user_reads(firestore_client):
+    return firestore_client.reads.count(USER_KEY)
+
+
+@pytest.mark.asyncio
+async def test_second_read_within_ttl_hits_cache(firebase_service, firestore_client, stored_user):
+    first = await firebase_service.get_user(DEVICE_ID)
+    second = await firebase_service.get_user(DEVICE_ID)
+
+    assert second is first
+    assert user_reads(firestore_client) == 1
+
+
+@pytest.mark.asyncio
+async def test_read_after_ttl_goes_to_firestore(firebase_service, firestore_client, stored_user):
+    firebase_service.user_cache_ttl = 0
+
+    await firebase_service.get_user(DEVICE_ID)
+    await firebase_service.get_user(DEVICE_ID)
+
+    assert user_reads(firestore_client) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("write", [
+    lambda service: service.update_user(DEVICE_ID, {"name": "Ravi"}),
+    lambda service: service.append_user_progress(DEVICE_ID, ["adios"], ["greetings"]),
+    lambda service: service.advance_user_episode(DEVICE_ID, 7),
+    lambda service: service.deactivate_user(DEVICE_ID),
+], ids=["update_user", "append_user_progress", "advance_user_episode", "deactivate_user"])
+async def test_writes_invalidate_cached_user(firebase_service, firestore_client, stored_user, write):
+    await firebase_service.get_user(DEVICE_ID)
+
+    await write(firebase_service)
+    user = await firebase_service.get_user(DEVICE_ID)
+
+    # Matches the stored document, not the copy cached before the write
+    assert user == firebase_service._dict_to_user(firestore_client.store[USER_KEY])
+    assert user != stored_user
+
+
+
+@pytest.mark.asyncio
+async def test_advance_writes_only_advanced_fields(firebase_service, firestore_client, stored_user):
+    old_progress, user = await firebase_service.advance_user_episode(DEVICE_ID, 7)
+
+    assert old_progress["episode"] == 1
+    assert user.progress.episode == 2
+    _, updates = firestore_client.writes[-1]
+    assert set(updates) == {
+        "progress.season", "progress.episode", "progress.episodes_completed",
+        "last_completed_episode", "last_active",
+    }
@@ -0,0 +1,22 @@
+"""
+Smoke tests: every service module must import cleanly
+"""
+import importlib
+
+import pytest
+
+
+# Third-party packages the service modules need at import time
+for _module in ("websockets", "pydantic_settings", "firebase_admin", "fastapi"):
+    pytest.importorskip(_module)
+
+
+@pytest.mark.parametrize("module", [
+    "services.openai_service",
+    "services.firebase_service",
+    "services.prompt_service",
+    "services.user_service",
+    "services.websocket_service",
+])
+def test_module_imports(module):
+    importlib.import_module(module)
@@ -0,0 +1,220 @@
+"""
+Tests for the OpenAI connection's audio send and receive paths
+"""
+import asyncio
+import base64
+import json
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+pytest.importorskip("pydantic_settings")
+
+from services.openai_service import (  # noqa: E402
+    OpenAIConnection, _COMMIT_MESSAGE, _CONNECTED, _READY
+)
+
+
+class FakeWebSocket:
+    """Records sent frames; sends block while the gate is closed"""
+
+    def __init__(self, incoming=()):
+        self.sent = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.closed = False
+        self._incoming = list(incoming)
+
+    async def send(self, message):
+        await self.gate.wait()
+        self.sent.append(message)
+
+    async def recv(self):
+        if not self._incoming:
+            raise websockets.ConnectionClosed(None, None)
+        return self._incoming.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+async def _ignore_audio(device_id, audio_data):
+    pass
+
+
+def make_connection(websocket: FakeWebSocket) -> OpenAIConnection:
+    """A ready connection with its sender running, without dialling OpenAI"""
+    connection = OpenAIConnection("ABCD1234", "You are a tutor", "key", _ignore_audio)
+    connection.websocket = websocket
+    connection._state = _READY
+    connection._send_queue = asyncio.Queue()
+    connection._playback_queue = asyncio.Queue()
+    connection._sender_task = asyncio.create_task(connection._sender_loop())
+    return connection
+
+
+async def settle():
+    """Let queued tasks run until they block"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def appended_audio(message: str) -> bytes:
+    """PCM payload of an input_audio_buffer.append frame"""
+    data = json.loads(message)
+    assert data["type"] == "input_audio_buffer.append"
+    return base64.b64decode(data["audio"])
+
+
+@pytest.mark.asyncio
+async def test_appends_are_coalesced_up_to_minimum_size():
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+    connection.max_audio_delay_ms = 60_000
+    chunk_size = connection._min_bytes // 4
+    chunks = [bytes([i]) * chunk_size for i in range(4)]
+
+    for chunk in chunks[:3]:
+        assert await connection.send_audio(chunk)
+        await settle()
+    assert websocket.sent == []
+
+    assert await connection.send_audio(chunks[3])
+    await settle()
+    assert len(websocket.sent) == 1
+    assert appended_audio(websocket.sent[0]) == b"".join(chunks)
+
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_timer_flushes_partial_buffer():
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+    connection.max_audio_delay_ms = 10
+    chunk = b"\x01" * (connection._min_bytes // 4)
+
+    await connection.send_audio(chunk)
+    await settle()
+    assert websocket.sent == []
+
+    await asyncio.sleep(0.05)
+    assert len(websocket.sent) == 1
+    assert appended_audio(websocket.sent[0]) == chunk
+
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_control_goes_out_after_audio_queued_before_it():
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+    connection.max_audio_delay_ms = 60_000
+    chunk = b"\x02" * (connection._min_bytes // 4)
+
+    await connection.send_audio(chunk)
+    assert await connection.commit_audio_buffer()
+
+    assert len(websocket.sent) == 2
+    assert appended_audio(websocket.sent[0]) == chunk
+    assert websocket.sent[1] == _COMMIT_MESSAGE
+
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_audio_dropped_past_cap_but_control_is_not():
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+    connection.max_queued_audio = 2
+    full = b"\x03" * connection._min_bytes
+
+    # The first chunk fills a batch and stalls in send
+    websocket.gate.clear()
+    await connection.send_audio(full)
+    await settle()
+
+    assert await connection.send_audio(b"\x04" * 320)
+    assert await connection.send_audio(b"\x05" * 320)
+    assert not await connection.send_audio(b"\x06" * 320)
+    assert connection.drops == 1
+
+    # Control messages and timer wake-ups don't count against the cap
+    commit = asyncio.create_task(connection.commit_audio_buffer())
+    connection._send_queue.put_nowait(None)
+    await settle()
+    assert not commit.done()
+    assert connection._queued_audio == 2
+
+    websocket.gate.set()
+    assert await commit
+    assert websocket.sent[-1] == _COMMIT_MESSAGE
+    assert appended_audio(websocket.sent[-2]) == b"\x04" * 320 + b"\x05" * 320
+    assert connection._queued_audio == 0
+
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_close_fails_pending_control_messages():
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+
+    websocket.gate.clear()
+    await connection.send_audio(b"\x07" * connection._min_bytes)
+    await settle()
+    commit = asyncio.create_task(connection.commit_audio_buffer())
+    await settle()
+
+    await connection.close()
+
+    assert await commit is False
+    assert websocket.closed
+    assert not connection.is_connected
+
+
+async def received_deltas(messages):
+    """Run the listen loop over messages; return what reached playback"""
+    connection = OpenAIConnection("ABCD1234", "You are a tutor", "key", _ignore_audio)
+    connection.websocket = FakeWebSocket(messages)
+    connection._state = _CONNECTED
+    connection._send_queue = asyncio.Queue()
+    connection._playback_queue = asyncio.Queue()
+
+    await connection._listen_loop()
+
+    assert not connection.is_connected
+    queued = []
+    while not connection._playback_queue.empty():
+        queued.append(connection._playback_queue.get_nowait())
+    # The listen loop wakes playback with None when it ends
+    assert queued.pop() is None
+    return queued
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("message", [
+    # Compact serialization, as OpenAI sends it
+    '{"type":"response.audio.delta","event_id":"e1","response_id":"r1",'
+    '"item_id":"i1","output_index":0,"content_index":0,"delta":"AAEC/w+A"}',
+    # Delta key before the type
+    '{"delta":"AAEC/w+A","type":"response.audio.delta","event_id":"e1"}',
+    # Spaces after the separators
+    '{"type": "response.audio.delta", "delta": "AAEC/w+A"}',
+    # Escaped slash in the payload: must fall back to the full parse
+    '{"type":"response.audio.delta","event_id":"e1","delta":"AAEC\\/w+A"}',
+])
+async def test_fast_path_delta_matches_full_parse(message):
+    orjson = pytest.importorskip("orjson")
+
+    assert await received_deltas([message]) == [orjson.loads(message)["delta"]]
+
+
+@pytest.mark.asyncio
+async def test_non_delta_events_are_not_forwarded():
+    messages = [
+        '{"type":"response.audio_transcript.delta","delta":"hello"}',
+        '{"type":"response.done","response":{"id":"r1"}}',
+    ]
+
+    assert await received_deltas(messages) == []
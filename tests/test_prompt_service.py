@@ -0,0 +1,204 @@
+"""
+Tests for PromptService's prompt cache and uploads
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from models.system_prompt import PromptType, SystemPrompt  # noqa: E402
+
+SEASON, EPISODE = 1, 1
+PROMPT_KEY = ("system_prompts", f"season_{SEASON}_episode_{EPISODE}")
+
+
+@pytest.fixture
+def prompt_service(monkeypatch, firebase_service):
+    import services.prompt_service as module
+
+    monkeypatch.setattr(module, "get_firebase_service", lambda: firebase_service)
+    return module.PromptService()
+
+
+def store_prompt(firebase_service, firestore_client, text, **fields):
+    prompt = SystemPrompt(season=SEASON, episode=EPISODE, prompt=text,
+                          prompt_type=PromptType.LEARNING, **fields)
+    firestore_client.store[PROMPT_KEY] = firebase_service._system_prompt_to_dict(prompt)
+
+
+def prompt_reads(firestore_client):
+    return firestore_client.reads.count(PROMPT_KEY)
+
+
+def age_entry(prompt_service, seconds_past_expiry):
+    """Move the cached entry's expiry into the past"""
+    key = (SEASON, EPISODE)
+    expiry, prompt = prompt_service._prompt_cache[key]
+    prompt_service._prompt_cache[key] = (time.monotonic() - seconds_past_expiry, prompt)
+
+
+@pytest.mark.asyncio
+async def test_fresh_entry_is_served_without_refresh(prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+
+    first = await prompt_service._get_prompt(SEASON, EPISODE)
+    second = await prompt_service._get_prompt(SEASON, EPISODE)
+
+    assert second is first
+    assert prompt_reads(firestore_client) == 1
+    assert not prompt_service._refresh_tasks
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_refreshed_once(prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+    await prompt_service._get_prompt(SEASON, EPISODE)
+    age_entry(prompt_service, 1)
+    store_prompt(firebase_service, firestore_client, "You are a cheerful tutor")
+
+    first = await prompt_service._get_prompt(SEASON, EPISODE)
+    second = await prompt_service._get_prompt(SEASON, EPISODE)
+
+    assert first.prompt == second.prompt == "You are a patient tutor"
+    assert len(prompt_service._refresh_tasks) == 1
+    await asyncio.gather(*prompt_service._refresh_tasks.values())
+
+    assert prompt_reads(firestore_client) == 2
+    refreshed = await prompt_service._get_prompt(SEASON, EPISODE)
+    assert refreshed.prompt == "You are a cheerful tutor"
+    assert not prompt_service._refresh_tasks
+
+
+@pytest.mark.asyncio
+async def test_entry_past_twice_ttl_is_fetched_synchronously(prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+    await prompt_service._get_prompt(SEASON, EPISODE)
+    age_entry(prompt_service, prompt_service.prompt_cache_ttl + 1)
+    store_prompt(firebase_service, firestore_client, "You are a cheerful tutor")
+
+    prompt = await prompt_service._get_prompt(SEASON, EPISODE)
+
+    assert prompt.prompt == "You are a cheerful tutor"
+    assert not prompt_service._refresh_tasks
+
+
+@pytest.mark.asyncio
+async def test_refresh_of_deleted_prompt_evicts_entry(prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+    await prompt_service._get_prompt(SEASON, EPISODE)
+    age_entry(prompt_service, 1)
+    del firestore_client.store[PROMPT_KEY]
+
+    await prompt_service._get_prompt(SEASON, EPISODE)
+    await asyncio.gather(*prompt_service._refresh_tasks.values())
+
+    assert (SEASON, EPISODE) not in prompt_service._prompt_cache
+
+
+@pytest.mark.asyncio
+async def test_invalidate_cancels_inflight_refresh(monkeypatch, prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+    old = await prompt_service._get_prompt(SEASON, EPISODE)
+    age_entry(prompt_service, 1)
+
+    # The refresh reads the old copy, then stalls before storing it
+    release = asyncio.Event()
+
+    async def slow_read(season, episode):
+        await release.wait()
+        return old
+
+    monkeypatch.setattr(firebase_service, "get_system_prompt", slow_read)
+    await prompt_service._get_prompt(SEASON, EPISODE)
+    refresh = prompt_service._refresh_tasks[(SEASON, EPISODE)]
+
+    prompt_service._invalidate_prompt(SEASON, EPISODE)
+    release.set()
+    await asyncio.gather(refresh, return_exceptions=True)
+
+    assert refresh.cancelled()
+    assert (SEASON, EPISODE) not in prompt_service._prompt_cache
+
+
+def prompt_request(text="You are a patient tutor who helps children learn",
+                   prompt_type=PromptType.LEARNING, metadata=None):
+    from models.system_prompt import SystemPromptRequest
+
+    return SystemPromptRequest(season=SEASON, episode=EPISODE, prompt=text,
+                               prompt_type=prompt_type, metadata=metadata or {"level": "a1"})
+
+
+@pytest.fixture
+def uploads(monkeypatch, prompt_service):
+    """Record upload log entries and cache invalidations"""
+    import services.prompt_service as module
+
+    recorded = {"uploads": [], "invalidations": []}
+    monkeypatch.setattr(module, "log_system_prompt_upload",
+                        lambda *args: recorded["uploads"].append(args))
+    invalidate = prompt_service._invalidate_prompt
+
+    def record_invalidation(season, episode):
+        recorded["invalidations"].append((season, episode))
+        invalidate(season, episode)
+
+    monkeypatch.setattr(prompt_service, "_invalidate_prompt", record_invalidation)
+    return recorded
+
+
+@pytest.mark.asyncio
+async def test_identical_upload_skips_write_and_upload_log(prompt_service, firestore_client, uploads):
+    await prompt_service.create_system_prompt(prompt_request())
+    writes = len(firestore_client.writes)
+
+    response = await prompt_service.create_system_prompt(prompt_request())
+
+    assert len(firestore_client.writes) == writes
+    assert len(uploads["uploads"]) == 1
+    assert len(uploads["invalidations"]) == 1
+    assert response.version == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("changed", [
+    prompt_request(text="You are a cheerful tutor who helps children learn"),
+    prompt_request(prompt_type=PromptType.REVIEW),
+    prompt_request(metadata={"level": "a2"}),
+], ids=["prompt", "prompt_type", "metadata"])
+async def test_changed_upload_writes_new_version(prompt_service, firestore_client, uploads, changed):
+    await prompt_service.create_system_prompt(prompt_request())
+    writes = len(firestore_client.writes)
+
+    response = await prompt_service.create_system_prompt(changed)
+
+    assert len(firestore_client.writes) == writes + 1
+    assert len(uploads["uploads"]) == 2
+    assert len(uploads["invalidations"]) == 2
+    assert response.version == 2
+
+
+@pytest.mark.asyncio
+async def test_seasons_overview_lists_prompt_types(prompt_service, firebase_service, firestore_client):
+    store_prompt(firebase_service, firestore_client, "You are a patient tutor")
+
+    overviews = await prompt_service.get_all_seasons_overview()
+
+    assert overviews[0].completed_episodes == 1
+    assert overviews[0].available_prompt_types == ["learning"]
+    assert all(overview.completed_episodes == 0 for overview in overviews[1:])
+
+
+@pytest.mark.asyncio
+async def test_bad_season_gets_empty_overview(monkeypatch, prompt_service, firebase_service):
+    async def grouped():
+        return {1: [object()]}
+
+    monkeypatch.setattr(firebase_service, "get_all_prompts_grouped_by_season", grouped)
+
+    overviews = await prompt_service.get_all_seasons_overview()
+
+    assert overviews[0].completed_episodes == 0
+    assert overviews[0].available_prompt_types == []
+    assert len(overviews) == prompt_service.firebase_service.settings.max_seasons
@@ -142,6 +142,10 @@ class ApplicationLogger:
 class LoggerMixin:
     """Mixin class to add logging capabilities to other classes"""
     
+    # Lets subclasses declare __slots__ and drop the per-instance __dict__;
+    # subclasses without __slots__ are unaffected
+    __slots__ = ('logger',)
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -6,6 +6,31 @@ from typing import Optional, Tuple
 from config.settings import get_settings
 
 
+# Patterns are compiled once at import rather than looked up in re's
+# cache on every call. The device ID pattern comes from settings, which
+# are fixed for the life of the process.
+_DEVICE_ID_PATTERN = re.compile(get_settings().device_id_pattern)
+_USER_NAME_PATTERN = re.compile(r"^[a-zA-Z\s\-'.]+$")
+
+# Prompt content checks, one scan each over the lowercased prompt
+_ROLE_PHRASES = re.compile('you are|your role|assistant')
+_PROBLEMATIC_WORDS = re.compile('kill|harm|illegal|violence')
+
+# Input sanitisation, applied in this order
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+_SQL_INJECTION_PATTERNS = tuple(
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r';\s*drop\s+table',
+        r';\s*delete\s+from',
+        r';\s*insert\s+into',
+        r';\s*update\s+',
+        r'union\s+select',
+        r'--',
+        r'/\*.*\*/'
+    )
+)
+
+
 class DeviceValidator:
     """Device ID validation utilities"""
     
@@ -23,9 +48,7 @@ class DeviceValidator:
         if not device_id:
             return False
         
-        settings = get_settings()
-        pattern = settings.device_id_pattern
-        return bool(re.match(pattern, device_id))
+        return bool(_DEVICE_ID_PATTERN.match(device_id))
     
     @staticmethod
     def get_device_validation_error(device_id: str) -> Optional[str]:
@@ -127,7 +150,7 @@ class UserValidator:
             return False, "Name cannot exceed 100 characters"
         
         # Check for valid characters (letters, spaces, common punctuation)
-        if not re.match(r"^[a-zA-Z\s\-'.]+$", name):
+        if not _USER_NAME_PATTERN.match(name):
             return False, "Name contains invalid characters"
         
         return True, None
@@ -208,16 +231,18 @@ class PromptValidator:
         if len(prompt) > 5000:
             issues.append("Prompt should not exceed 5000 characters")
         
+        # Lowercased once for all of the keyword checks below
+        prompt_lower = prompt.lower()
+        
         # Check for common prompt best practices
-        if not any(word in prompt.lower() for word in ['you are', 'your role', 'assistant']):
+        if not _ROLE_PHRASES.search(prompt_lower):
             issues.append("Consider starting with role definition (e.g., 'You are...')")
         
         if '{{' in prompt or '}}' in prompt:
             issues.append("Prompt contains template placeholders that should be filled")
         
         # Check for potentially problematic content
-        problematic_words = ['kill', 'harm', 'illegal', 'violence']
-        if any(word in prompt.lower() for word in problematic_words):
+        if _PROBLEMATIC_WORDS.search(prompt_lower):
             issues.append("Prompt may contain inappropriate content")
         
         return len(issues) == 0, issues
@@ -278,20 +303,10 @@ class SecurityValidator:
             return ""
         
         # Remove potential HTML/script tags
-        input_data = re.sub(r'<[^>]*>', '', input_data)
+        input_data = _HTML_TAG_PATTERN.sub('', input_data)
         
         # Remove potential SQL injection patterns
-        sql_patterns = [
-            r';\s*drop\s+table',
-            r';\s*delete\s+from',
-            r';\s*insert\s+into',
-            r';\s*update\s+',
-            r'union\s+select',
-            r'--',
-            r'/\*.*\*/'
-        ]
-        
-        for pattern in sql_patterns:
-            input_data = re.sub(pattern, '', input_data, flags=re.IGNORECASE)
+        for pattern in _SQL_INJECTION_PATTERNS:
+            input_data = pattern.sub('', input_data)
         
         return input_data.strip()
\ No newline at end of file